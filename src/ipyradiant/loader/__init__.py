@@ -3,5 +3,9 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
-__all__ = ["LoadWidget"]
+__all__ = ["EntityIndex", "GraphDelta", "LoadWidget", "ParseCache", "TripleTable"]
+from .cache import ParseCache
+from .delta import GraphDelta
 from .loader import LoadWidget
+from .search import EntityIndex
+from .triple_table import TripleTable
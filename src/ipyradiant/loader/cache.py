@@ -0,0 +1,87 @@
+""" a content-addressed cache of parsed files
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("IPYRADIANT_CACHE", Path.home() / ".cache" / "ipyradiant")
+)
+
+
+class ParseCache:
+    """Parsed quads keyed by a hash of the uploaded bytes.
+
+    Entries are pickled to ``cache_dir`` and evicted least-recently-used first
+    once the directory grows beyond ``max_size`` bytes. It holds no open
+    handles, so it can be handed to worker processes.
+
+    :param cache_dir: where cached entries are written.
+    :param max_size: the size in bytes the cache is trimmed back to.
+    """
+
+    suffix = ".pickle"
+    # bumped whenever the shape of the cached values changes
+    version = 2
+
+    def __init__(self, cache_dir=None, max_size: int = 2 ** 32):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR / "parsed")
+        self.max_size = max_size
+
+    @classmethod
+    def key(cls, content: bytes, kind: str) -> str:
+        """hash ``content``, along with the ``kind`` of file it is parsed as"""
+        digest = hashlib.sha256(f"{cls.version}:{kind}".encode("utf-8"))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            with path.open("rb") as fp:
+                value = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # mark as recently used for eviction
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+
+    def entries(self) -> list:
+        """cached files, least recently used first"""
+        if not self.cache_dir.exists():
+            return []
+        return sorted(
+            self.cache_dir.glob(f"*{self.suffix}"), key=lambda p: p.stat().st_mtime
+        )
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.entries())
+
+    def evict(self):
+        """drop least recently used entries until the cache fits in ``max_size``"""
+        entries = self.entries()
+        size = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if size <= self.max_size:
+                break
+            size -= path.stat().st_size
+            path.unlink()
+
+    def clear(self):
+        for path in self.entries():
+            path.unlink()
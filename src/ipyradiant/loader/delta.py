@@ -0,0 +1,78 @@
+""" the difference between two loads of a graph
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+from rdflib import ConjunctiveGraph
+
+from .search import EntityIndex
+from .stats import GraphStats
+
+
+def graph_quads(graph: ConjunctiveGraph) -> set:
+    return {(s, p, o, c.identifier) for s, p, o, c in graph.quads((None, None, None))}
+
+
+class GraphDelta:
+    """The quads added to and removed from a graph by a reload.
+
+    ``added``/``removed`` hold the (s, p, o) triples whose presence in the
+    union of all named graphs changed, which is what downstream widgets draw.
+
+    :param added_quads: (s, p, o, graph identifier) quads that are new.
+    :param removed_quads: (s, p, o, graph identifier) quads that are gone.
+    """
+
+    def __init__(self, added_quads: set, removed_quads: set, added: set, removed: set):
+        self.added_quads = added_quads
+        self.removed_quads = removed_quads
+        self.added = added
+        self.removed = removed
+
+    @classmethod
+    def between(cls, old: ConjunctiveGraph, new: ConjunctiveGraph):
+        old_quads = graph_quads(old)
+        new_quads = graph_quads(new)
+        old_triples = {quad[:3] for quad in old_quads}
+        new_triples = {quad[:3] for quad in new_quads}
+        return cls(
+            new_quads - old_quads,
+            old_quads - new_quads,
+            new_triples - old_triples,
+            old_triples - new_triples,
+        )
+
+    def __bool__(self):
+        return bool(self.added_quads or self.removed_quads)
+
+    def __repr__(self):
+        return (
+            f"<GraphDelta +{len(self.added_quads)} -{len(self.removed_quads)} quads>"
+        )
+
+    def apply(
+        self,
+        graph: ConjunctiveGraph,
+        stats: GraphStats = None,
+        index: EntityIndex = None,
+    ):
+        """change ``graph`` (and its ``stats`` and ``index``) in place to match the
+        new load"""
+        for s, p, o, identifier in self.removed_quads:
+            graph.remove((s, p, o, graph.get_context(identifier)))
+        graph.addN(
+            (s, p, o, graph.get_context(identifier))
+            for s, p, o, identifier in self.added_quads
+        )
+        if stats is not None:
+            # stats count the union graph, as GraphStats.from_graph does
+            for triple in self.removed:
+                stats.remove(triple)
+            for triple in self.added:
+                stats.add(triple)
+        if index is not None:
+            # the index follows the union graph, as the visualizers do
+            for triple in self.removed:
+                index.remove(triple)
+            for triple in self.added:
+                index.add(triple)
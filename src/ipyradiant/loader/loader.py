@@ -3,33 +3,78 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
+import threading
+from operator import not_
+import traceback
+import warnings
+from glob import glob
+from pathlib import Path
+
 import traitlets as T
 
 import ipywidgets as W
-from rdflib import BNode, Graph
-from rdflib.util import SUFFIX_FORMAT_MAP, guess_format
-
-
-def get_n_subjects(graph: Graph):
-    return len(set(graph.subjects(None, None)))
+from rdflib import BNode, ConjunctiveGraph, Graph
 
-
-def get_n_predicates(graph: Graph):
-    return len(set(graph.predicates(None, None)))
+from .cache import ParseCache
+from .delta import GraphDelta
+from .parsing import (
+    FILE_SUFFIXES,
+    file_identifier,
+    parse_files,
+    parse_paths,
+    path_identifier,
+)
+from .progress import LoadCancelled, LoadProgress
+from .search import EntityIndex
+from .stats import GraphStats
+from .triple_table import TripleTable
 
 
 class LoadBox(W.HBox):
-    formats = ",".join(["." + ext for ext in SUFFIX_FORMAT_MAP.keys()])
+    formats = ",".join(FILE_SUFFIXES)
     graph = T.Instance(Graph)
     graph_id = T.Instance(BNode)
+    graph_stats = T.Instance(GraphStats)
+    entity_index = T.Instance(EntityIndex)
     label = T.Instance(W.Label)
     file_upload = T.Instance(W.FileUpload)
     file_upload_value = T.Dict()
+    path = T.Instance(W.Text)
+    path_button = T.Instance(W.Button)
+    file_metadata = T.Dict()
+    max_workers = T.Int(default_value=None, allow_none=True)
+    # rdflib store plugin (and its configuration) that loaded files are parsed into
+    store = T.Unicode(default_value="Memory")
+    store_configuration = T.Unicode(default_value=None, allow_none=True)
+    # the graph opened by the last load, closed once a new load replaces it
+    loaded_graph = T.Instance(Graph, allow_none=True)
+    batch_size = T.Int(default_value=10000)
+    parse_cache = T.Instance(ParseCache, allow_none=True)
+    # load into a TripleTable instead of the rdflib graph: ``graph`` is then left
+    # empty, so SPARQL queries against it (e.g. a linked QueryWidget) find nothing
+    compact = T.Bool(default_value=False)
+    triple_table = T.Instance(TripleTable, allow_none=True)
+    # apply a reload to the current graph in place, publishing what changed as
+    # graph_delta: ``graph`` itself does not change, so only widgets that also
+    # link graph_delta see the reload
+    delta_reload = T.Bool(default_value=False)
+    graph_delta = T.Instance(GraphDelta, allow_none=True)
+    # background loading
+    background = T.Bool(default_value=True)
+    loading = T.Bool(default_value=False)
+    load_status = T.Unicode()
+    load_progress = T.Instance(LoadProgress, allow_none=True)
+    load_thread = T.Instance(threading.Thread, allow_none=True)
+    bytes_total = T.Int()
+    bytes_parsed = T.Int()
+    n_loaded = T.Int()
     log = W.Output()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.children = tuple([self.label, self.file_upload])
+        self.children = tuple(
+            [self.label, self.file_upload, self.path, self.path_button]
+        )
         T.dlink((self.file_upload, "value"), (self, "file_upload_value"))
 
     @T.default("graph")
@@ -40,6 +85,22 @@ class LoadBox(W.HBox):
     def make_default_graph_id(self):
         return self.graph.identifier
 
+    @T.default("graph_stats")
+    def make_default_graph_stats(self):
+        return GraphStats.from_graph(self.graph)
+
+    @T.default("entity_index")
+    def make_default_entity_index(self):
+        return EntityIndex.from_graph(self.graph)
+
+    @T.observe("compact")
+    def warn_compact(self, change):
+        if change.new:
+            warnings.warn(
+                "Compact loads fill triple_table only: the graph stays empty, "
+                "so SPARQL queries against it will return no rows."
+            )
+
     @T.default("label")
     def make_default_label(self):
         label = W.Label(value="Click to load file:")
@@ -47,30 +108,175 @@ class LoadBox(W.HBox):
 
     @T.default("file_upload")
     def make_default_file_upload(self):
-        # TODO support multiple files
-        file_upload = W.FileUpload(accept=self.formats, multiple=False)
+        file_upload = W.FileUpload(accept=self.formats, multiple=True)
         return file_upload
 
+    @T.default("path")
+    def make_default_path(self):
+        path = W.Text(placeholder="or a path (or glob) on the kernel host")
+        return path
+
+    @T.default("path_button")
+    def make_default_path_button(self):
+        button = W.Button(
+            description="Load",
+            icon="folder-open",
+            tooltip="Click to load files from the kernel host.",
+        )
+        button.on_click(self.process_path)
+        return button
+
+    @log.capture()
+    def process_path(self, button):
+        paths = sorted(glob(self.path.value))
+        if not paths:
+            raise FileNotFoundError(f"No files match: {self.path.value}")
+        self.load_paths(paths)
+
+    def load_paths(self, paths):
+        """load files that already sit on the kernel host, without uploading them"""
+        paths = [str(path) for path in paths]
+
+        def load(progress):
+            graph, stats, table = parse_paths(
+                paths,
+                max_workers=self.max_workers,
+                store=self.store,
+                configuration=self.store_configuration,
+                batch_size=self.batch_size,
+                progress=progress,
+                compact=self.compact,
+            )
+            file_metadata = {
+                path: {"size": Path(path).stat().st_size} for path in paths
+            }
+            if table is None:
+                for path, metadata in file_metadata.items():
+                    metadata["length"] = len(graph.get_context(path_identifier(path)))
+            return graph, stats, table, file_metadata
+
+        self.start_load(load, sum(Path(path).stat().st_size for path in paths))
+
     @T.observe("file_upload_value")
     def process_files(self, change):
-        # TODO loader for files (not needed until support for >1 file)
+        if not change.new:
+            return
         # size is in bytes
-        file_graphs = {}
+        file_metadata = {}
         for file_name, data in change.new.items():
-            assert "metadata" and "content" in data
-            assert file_name not in file_graphs
-            file_graphs[file_name] = {}
-            file_graphs[file_name]["metadata"] = data["metadata"]
-            file_format = guess_format(file_name)
-            if file_format is None:
-                raise ValueError("Unknown file format.")
-            g = Graph().parse(data=data["content"], format=file_format)
-            file_graphs[file_name]["graph"] = g
-            file_graphs[file_name]["metadata"]["length"] = len(g)
-
-            # TODO combine graphs when multiple=True
-            self.graph = g
-            self.graph_id = g.identifier
+            assert "metadata" in data and "content" in data
+            file_metadata[file_name] = dict(data["metadata"])
+        files = {file_name: data["content"] for file_name, data in change.new.items()}
+
+        def load(progress):
+            graph, stats, table = parse_files(
+                files,
+                max_workers=self.max_workers,
+                store=self.store,
+                configuration=self.store_configuration,
+                batch_size=self.batch_size,
+                cache=self.parse_cache,
+                progress=progress,
+                compact=self.compact,
+            )
+            if table is None:
+                for file_name, metadata in file_metadata.items():
+                    context = graph.get_context(file_identifier(file_name))
+                    metadata["length"] = len(context)
+            return graph, stats, table, file_metadata
+
+        self.start_load(load, sum(len(content) for content in files.values()))
+
+    def start_load(self, load, bytes_total: int):
+        """run ``load(progress)``, in a background thread if ``background``
+
+        ``graph`` and ``graph_id`` are only replaced once the load completes.
+        """
+        if self.loading:
+            raise RuntimeError("Wait for (or cancel) the current load first.")
+        # the log only shows what went wrong with the latest load
+        self.log.outputs = ()
+        self.load_progress = LoadProgress(bytes_total, callback=self.update_progress)
+        self.bytes_total = bytes_total
+        self.update_progress(self.load_progress)
+        self.load_status = "loading"
+        self.loading = True
+        if self.background:
+            self.load_thread = threading.Thread(
+                target=self.run_load, args=(load,), daemon=True
+            )
+            self.load_thread.start()
+        else:
+            self.run_load(load)
+
+    def run_load(self, load):
+        try:
+            graph, stats, table, file_metadata = load(self.load_progress)
+        except LoadCancelled:
+            self.load_status = "cancelled"
+        except Exception:
+            self.load_status = "failed"
+            self.log.append_stderr(traceback.format_exc())
+        else:
+            self.file_metadata = file_metadata
+            self.update_graph(graph, stats, table)
+            self.load_status = "loaded"
+        finally:
+            self.loading = False
+
+    def update_progress(self, progress: LoadProgress):
+        self.bytes_parsed = progress.bytes_parsed
+        self.n_loaded = progress.n_triples
+
+    def cancel_load(self):
+        """stop the current load after its running unit of work"""
+        if self.load_progress is not None:
+            self.load_progress.cancel()
+
+    def wait(self, timeout: float = None):
+        """block until the current background load (if any) is done"""
+        if self.load_thread is not None:
+            self.load_thread.join(timeout)
+
+    def update_graph(self, graph, stats, table=None):
+        if self.can_apply_delta(graph, table):
+            delta = GraphDelta.between(self.graph, graph)
+            delta.apply(self.graph, self.graph_stats, self.entity_index)
+            self.graph_delta = delta
+            return
+        # indexed only once searched
+        if table is None:
+            self.entity_index = EntityIndex.from_graph(graph)
+        else:
+            self.entity_index = EntityIndex(
+                identifier=graph.identifier, source=table.triples
+            )
+        previous = self.graph
+        self.graph_stats = stats
+        self.triple_table = table
+        self.graph = graph
+        self.graph_id = graph.identifier
+        if previous is self.loaded_graph and previous is not graph:
+            # release the store (and any files or connections) of the old load;
+            # a graph given to the widget is left to whoever gave it
+            previous.close()
+        self.loaded_graph = graph
+
+    def can_apply_delta(self, graph, table=None) -> bool:
+        """whether a new load can be applied to the current graph as a delta
+
+        Only in-memory, non-empty loaded graphs are patched: a persistent store
+        already holds the reload, and a compact load has no graph to patch.
+        """
+        return (
+            self.delta_reload
+            and self.store == "Memory"
+            and table is None
+            and self.triple_table is None
+            and isinstance(self.graph, ConjunctiveGraph)
+            and isinstance(graph, ConjunctiveGraph)
+            and len(self.graph) > 0
+        )
 
 
 class LoadWidget(W.VBox):
@@ -83,31 +289,104 @@ class LoadWidget(W.VBox):
     n_triples = T.Int()
     n_subjects = T.Int()
     n_predicates = T.Int()
+    n_objects = T.Int()
+    n_classes = T.Int()
 
     graph = T.Instance(Graph)
     graph_id = T.Instance(BNode)
+    graph_stats = T.Instance(GraphStats)
+    entity_index = T.Instance(EntityIndex)
+    triple_table = T.Instance(TripleTable, allow_none=True)
+    graph_delta = T.Instance(GraphDelta, allow_none=True)
     stats = T.Instance(W.HTML)
+    progress_bar = T.Instance(W.IntProgress)
+    progress_label = T.Instance(W.Label)
+    cancel_button = T.Instance(W.Button)
+    progress_box = T.Instance(W.HBox)
 
     log = W.Output()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.load_box = LoadBox()
+        T.link((self.load_box, "graph_stats"), (self, "graph_stats"))
+        T.link((self.load_box, "entity_index"), (self, "entity_index"))
+        T.link((self.load_box, "triple_table"), (self, "triple_table"))
+        T.link((self.load_box, "graph_delta"), (self, "graph_delta"))
         T.link((self.load_box, "graph"), (self, "graph"))
         T.link((self.load_box, "graph_id"), (self, "graph_id"))
-        self.children = [self.load_box, self.stats]
+        T.dlink((self.load_box, "bytes_total"), (self.progress_bar, "max"))
+        T.dlink((self.load_box, "bytes_parsed"), (self.progress_bar, "value"))
+        # stay visible after a failed or cancelled load, to say what happened
+        T.dlink(
+            (self.load_box, "load_status"),
+            (self.progress_box.layout, "visibility"),
+            lambda x: "hidden" if x in ("", "loaded") else "visible",
+        )
+        T.dlink((self.load_box, "loading"), (self.cancel_button, "disabled"), not_)
+        self.load_box.observe(
+            self.update_progress_label, ["bytes_parsed", "n_loaded", "load_status"]
+        )
+        self.children = [
+            self.load_box,
+            self.progress_box,
+            self.load_box.log,
+            self.stats,
+        ]
+
+    @T.default("progress_bar")
+    def make_default_progress_bar(self):
+        return W.IntProgress(min=0, max=1)
+
+    @T.default("progress_label")
+    def make_default_progress_label(self):
+        return W.Label()
+
+    @T.default("cancel_button")
+    def make_default_cancel_button(self):
+        button = W.Button(
+            description="Cancel",
+            icon="stop",
+            tooltip="Click to stop loading; the current graph is kept.",
+        )
+        button.on_click(lambda button: self.load_box.cancel_load())
+        return button
+
+    @T.default("progress_box")
+    def make_default_progress_box(self):
+        return W.HBox(
+            [self.progress_bar, self.progress_label, self.cancel_button],
+            layout=W.Layout(visibility="hidden"),
+        )
+
+    def update_progress_label(self, change):
+        load_box = self.load_box
+        self.progress_label.value = (
+            f"{load_box.load_status}: {load_box.bytes_parsed:,} of "
+            f"{load_box.bytes_total:,} bytes parsed, {load_box.n_loaded:,} triples"
+        )
+        if load_box.load_status == "failed":
+            self.progress_label.value += " (see the error below)"
 
     @T.default("n_triples")
     def make_default_n_triples(self):
-        return len(self.graph), 0
+        return self.graph_stats.n_triples
 
     @T.default("n_subjects")
     def make_default_n_subjects(self):
-        return get_n_subjects(self.graph)
+        return self.graph_stats.n_subjects
 
     @T.default("n_predicates")
     def make_default_n_predicates(self):
-        return get_n_subjects(self.graph)
+        return self.graph_stats.n_predicates
+
+    @T.default("n_objects")
+    def make_default_n_objects(self):
+        return self.graph_stats.n_objects
+
+    @T.default("n_classes")
+    def make_default_n_classes(self):
+        return self.graph_stats.n_classes
 
     def build_html_str(self):
         return f"""
@@ -117,6 +396,8 @@ class LoadWidget(W.VBox):
                     <ul>
                         <li>n_subjects: {self.n_subjects}</li>
                         <li>n_predicates: {self.n_predicates}</li>
+                        <li>n_objects: {self.n_objects}</li>
+                        <li>n_classes: {self.n_classes}</li>
                     </ul>
                 </ul>
                 """
@@ -128,7 +409,24 @@ class LoadWidget(W.VBox):
 
     @T.observe("graph_id")
     def update_stats(self, change):
-        self.n_triples = len(self.graph)
-        self.n_subjects = get_n_subjects(self.graph)
-        self.n_predicates = get_n_predicates(self.graph)
+        if self.graph_stats.identifier != self.graph.identifier:
+            # the graph was replaced without going through the loader
+            self.graph_stats = GraphStats.from_graph(self.graph)
+        if self.entity_index.identifier != self.graph.identifier:
+            self.entity_index = EntityIndex.from_graph(self.graph)
+        self.refresh_stats()
+
+    @T.observe("graph_delta")
+    def update_stats_from_delta(self, change):
+        # the loader already applied the delta to graph_stats
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        """copy the counts from ``graph_stats``, which is kept current on add/remove"""
+        stats = self.graph_stats
+        self.n_triples = stats.n_triples
+        self.n_subjects = stats.n_subjects
+        self.n_predicates = stats.n_predicates
+        self.n_objects = stats.n_objects
+        self.n_classes = stats.n_classes
         self.stats.value = self.build_html_str()
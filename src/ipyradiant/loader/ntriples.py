@@ -0,0 +1,147 @@
+""" chunk-parallel N-Triples/N-Quads parsing
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import hashlib
+import io
+import mmap
+import os
+from functools import partial
+from pathlib import Path
+
+from rdflib import BNode, ConjunctiveGraph
+
+from .progress import LoadProgress, ProgressReader
+from .stats import GraphStats
+
+# below this many bytes per chunk, process start-up costs more than it saves
+MIN_CHUNK_SIZE = 2 ** 24
+
+
+class RangeReader(io.RawIOBase):
+    """a read-only binary file over the bytes ``start:end`` of a memory map"""
+
+    def __init__(self, mapped: mmap.mmap, start: int, end: int):
+        self.mapped = mapped
+        self.pos = start
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.pos)
+        buffer[:size] = self.mapped[self.pos : self.pos + size]
+        self.pos += size
+        return size
+
+
+def parsed_quads(graph: ConjunctiveGraph) -> tuple:
+    """the ``(s, p, o, graph name)`` quads of a parsed file, and their stats
+
+    Statements outside any named graph (all of them, for triple formats) get
+    ``None`` for a name: they go to the file's own graph when merged. The
+    stats count the union of the file's graphs.
+    """
+    default = graph.default_context.identifier
+    quads = [
+        (s, p, o, None if context.identifier == default else context.identifier)
+        for s, p, o, context in graph.quads((None, None, None))
+    ]
+    return quads, GraphStats(graph.triples((None, None, None)))
+
+
+class BNodeLabels(dict):
+    """maps blank node labels to the same BNode in every chunk of a file
+
+    rdflib normally mints a fresh BNode per label per parse, which would split
+    one blank node into several when its triples land in different chunks.
+    """
+
+    def __init__(self, salt: str):
+        super().__init__()
+        self.salt = salt
+
+    def get(self, label, default=None):
+        return BNode(f"{self.salt}{label}")
+
+    def __missing__(self, label):
+        return self.get(label)
+
+
+def file_salt(path) -> str:
+    """a prefix that keeps blank node labels of different files apart"""
+    stat = Path(path).stat()
+    key = f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"b{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+
+def content_salt(file_name: str, content: bytes) -> str:
+    """a prefix that keeps blank node labels of different uploads apart"""
+    digest = hashlib.sha1(file_name.encode("utf-8"))
+    digest.update(content)
+    return f"b{digest.hexdigest()[:12]}"
+
+
+def count_chunks(size: int, max_workers: int = None) -> int:
+    """how many chunks to parse ``size`` bytes of a line-based file in"""
+    return max(1, min(max_workers or os.cpu_count() or 1, size // MIN_CHUNK_SIZE))
+
+
+def line_ranges(data, n_chunks: int) -> list:
+    """split a buffer into at most ``n_chunks`` byte ranges ending on newlines"""
+    size = len(data)
+    step = max(1, size // max(1, n_chunks))
+    ranges = []
+    start = 0
+    while start < size:
+        newline = data.find(b"\n", min(start + step, size) - 1)
+        end = size if newline == -1 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def split_ranges(path, n_chunks: int) -> list:
+    """split a file into at most ``n_chunks`` byte ranges ending on newlines"""
+    if not Path(path).stat().st_size:
+        return []
+    with open(path, "rb") as fp, mmap.mmap(
+        fp.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        return line_ranges(mapped, n_chunks)
+
+
+def parse_range(
+    path,
+    start: int,
+    end: int,
+    file_format: str,
+    salt: str,
+    progress: LoadProgress = None,
+) -> tuple:
+    """parse the lines in ``start:end`` of a file into quads and their stats
+
+    Runs in a worker process: the file is memory-mapped, so the chunk is read
+    straight from the page cache rather than shipped from the parent.
+    """
+    g = ConjunctiveGraph()
+    with open(path, "rb") as fp, mmap.mmap(
+        fp.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        source = RangeReader(mapped, start, end)
+        if progress is not None:
+            source = ProgressReader(source, progress, end - start)
+        g.parse(source=source, format=file_format, bnode_context=BNodeLabels(salt))
+    return parsed_quads(g)
+
+
+def chunk_tasks(path, file_format: str, max_workers: int = None) -> list:
+    """one ``(n_bytes, parse_range)`` task per chunk of a line-based file"""
+    n_chunks = count_chunks(Path(path).stat().st_size, max_workers)
+    salt = file_salt(path)
+    return [
+        (end - start, partial(parse_range, str(path), start, end, file_format, salt))
+        for start, end in split_ranges(path, n_chunks)
+    ]
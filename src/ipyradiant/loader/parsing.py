@@ -0,0 +1,406 @@
+""" parsing helpers for the loading widgets
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import bz2
+import gzip
+import io
+import logging
+import lzma
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from itertools import chain, islice
+from pathlib import Path
+from urllib.parse import quote
+
+from rdflib import ConjunctiveGraph, URIRef
+from rdflib.util import SUFFIX_FORMAT_MAP, guess_format
+
+from .cache import ParseCache
+from .ntriples import (
+    BNodeLabels,
+    chunk_tasks,
+    content_salt,
+    count_chunks,
+    line_ranges,
+    parsed_quads,
+)
+from .progress import LoadProgress, ProgressReader
+from .stats import GraphStats
+from .triple_table import TripleTable
+
+logger = logging.getLogger(__name__)
+
+
+def file_identifier(file_name: str) -> URIRef:
+    """the named graph identifier used for a loaded file"""
+    return URIRef(f"file:///{quote(file_name)}")
+
+
+def path_identifier(path: str) -> URIRef:
+    """the named graph identifier used for a file loaded from the kernel host"""
+    return URIRef(Path(path).resolve().as_uri())
+
+
+# compression suffixes and the functions that decompress a binary stream lazily
+DECOMPRESSORS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+ARCHIVE_SUFFIX = ".zip"
+# line-based formats that are parsed in memory-mapped chunks
+MMAP_SUFFIXES = [".nt", ".nq"]
+
+FILE_SUFFIXES = [
+    *[f".{ext}" for ext in SUFFIX_FORMAT_MAP.keys()],
+    *[
+        f".{ext}{compression}"
+        for ext in SUFFIX_FORMAT_MAP.keys()
+        for compression in DECOMPRESSORS
+    ],
+    ARCHIVE_SUFFIX,
+]
+
+
+def guess_file_format(file_name: str) -> str:
+    file_format = guess_format(file_name)
+    if file_format is None:
+        raise ValueError(f"Unknown file format: {file_name}")
+    return file_format
+
+
+def is_rdf_file(file_name: str) -> bool:
+    """whether a (possibly compressed) file name has a known RDF format"""
+    base_name, compression = split_compression(file_name)
+    return compression == ARCHIVE_SUFFIX or guess_format(base_name) is not None
+
+
+def split_compression(file_name: str) -> tuple:
+    """split ``data.ttl.gz`` into ``("data.ttl", ".gz")``
+
+    Uncompressed names come back with an empty compression suffix.
+    """
+    lower = file_name.lower()
+    for suffix in [*DECOMPRESSORS, ARCHIVE_SUFFIX]:
+        if lower.endswith(suffix):
+            return file_name[: -len(suffix)], suffix
+    return file_name, ""
+
+
+def open_sources(file_name: str, stream):
+    """yield ``(format, stream)`` for every RDF document in an uploaded file
+
+    Compressed files are decompressed as the parser reads from the stream, and
+    every member of a zip archive is read straight out of the archive.
+    N-Triples, N-Quads and RDF/XML are parsed as they are read, so their
+    decompressed text is never held in memory all at once; rdflib reads the
+    others (e.g. Turtle, N3, TriG, JSON-LD) whole before parsing them. Archive
+    members that are not RDF (e.g. a README) are skipped, with a logged warning.
+    """
+    base_name, compression = split_compression(file_name)
+    if compression == ARCHIVE_SUFFIX:
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if not is_rdf_file(info.filename):
+                    logger.warning(
+                        "Skipped %s in %s: not an RDF file", info.filename, file_name
+                    )
+                    continue
+                with archive.open(info) as member:
+                    yield from open_sources(info.filename, member)
+    elif compression:
+        with DECOMPRESSORS[compression](stream, "rb") as decompressed:
+            yield guess_file_format(base_name), decompressed
+    else:
+        yield guess_file_format(base_name), stream
+
+
+def parse_stream(file_name: str, stream, salt: str = None) -> tuple:
+    """parse a binary stream into a list of quads and their stats
+
+    With a ``salt``, blank node labels are resolved as in any other chunk of
+    the same file (see ``BNodeLabels``).
+    """
+    g = ConjunctiveGraph()
+    options = {} if salt is None else {"bnode_context": BNodeLabels(salt)}
+    for file_format, source in open_sources(file_name, stream):
+        g.parse(source=source, format=file_format, **options)
+    return parsed_quads(g)
+
+
+def parse_file(
+    file_name: str,
+    content: bytes,
+    cache: ParseCache = None,
+    salt: str = None,
+    progress: LoadProgress = None,
+) -> tuple:
+    """parse the content of a single file into a list of quads and their stats
+
+    Runs in a worker process, so it returns plain (picklable) quads rather
+    than a Graph. When a ``cache`` is given, unchanged content is read back from
+    it instead of being parsed again. ``content`` may be one chunk of a larger
+    file, parsed with the file's ``salt``. A ``progress`` is updated as the
+    content is read, when parsed in the loading process itself.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if cache is not None:
+        base_name, kind = split_compression(file_name)
+        if kind != ARCHIVE_SUFFIX:
+            kind = guess_file_format(base_name) + kind
+        if salt is not None:
+            kind = f"{kind}:{salt}"
+        key = cache.key(content, kind)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    stream = io.BytesIO(content)
+    if progress is not None:
+        stream = ProgressReader(stream, progress, len(content))
+    parsed = parse_stream(file_name, stream, salt)
+
+    if cache is not None:
+        cache.put(key, parsed)
+    return parsed
+
+
+def file_tasks(
+    file_name: str, content: bytes, max_workers: int = None, cache: ParseCache = None
+) -> list:
+    """``(n_bytes, task)`` to parse an uploaded file
+
+    Large uncompressed N-Triples/N-Quads uploads are split into chunks at line
+    boundaries, one task each, like the files parsed by ``parse_paths``.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    n_chunks = count_chunks(len(content), max_workers)
+    if n_chunks == 1 or Path(file_name).suffix.lower() not in MMAP_SUFFIXES:
+        return [(len(content), partial(parse_file, file_name, content, cache=cache))]
+    salt = content_salt(file_name, content)
+    return [
+        (
+            end - start,
+            partial(parse_file, file_name, content[start:end], cache=cache, salt=salt),
+        )
+        for start, end in line_ranges(content, n_chunks)
+    ]
+
+
+def parse_path(path: str, progress: LoadProgress = None) -> tuple:
+    """parse a file on the kernel host into a list of quads and their stats
+
+    The file is streamed from disk rather than read into memory up front.
+    """
+    path = Path(path)
+    with path.open("rb") as fp:
+        stream = fp
+        if progress is not None:
+            stream = ProgressReader(fp, progress, path.stat().st_size)
+        return parse_stream(path.name, stream)
+
+
+def open_graph(store: str = "Memory", configuration: str = None) -> ConjunctiveGraph:
+    """make an empty graph backed by ``store``
+
+    A persistent store (e.g. ``"SQLAlchemy"`` from rdflib-sqlalchemy with a
+    ``sqlite:///graph.db`` configuration, or the built-in ``"BerkeleyDB"`` with a
+    directory) keeps graphs that are larger than the kernel's memory on disk.
+    """
+    graph = ConjunctiveGraph(store=store)
+    if configuration is not None:
+        graph.open(configuration, create=True)
+    return graph
+
+
+def add_in_batches(
+    graph: ConjunctiveGraph,
+    quads,
+    batch_size: int = 10000,
+    progress: LoadProgress = None,
+):
+    """bulk-insert ``quads``, committing once per batch rather than per triple"""
+    progress = progress or LoadProgress()
+    quads = iter(quads)
+    while True:
+        batch = list(islice(quads, batch_size))
+        if not batch:
+            break
+        graph.addN(batch)
+        graph.commit()
+        progress.update(n_triples=len(batch))
+
+
+def run_tasks(tasks: list, max_workers: int = None, progress: LoadProgress = None):
+    """call each ``(n_bytes, task)``, in a process pool when there is >1 task
+
+    Results come back in task order. Once ``progress`` is cancelled, tasks
+    that have not started yet are dropped; running ones finish their work. A
+    single task runs in this process instead, and takes ``progress`` to report
+    the bytes it reads and to stop as soon as it is cancelled.
+    """
+    progress = progress or LoadProgress()
+    progress.check()
+    if len(tasks) == 1:
+        n_bytes, task = tasks[0]
+        bytes_parsed = progress.bytes_parsed
+        result = task(progress=progress)
+        # e.g. a cached file is not read at all
+        progress.update(n_bytes=bytes_parsed + n_bytes - progress.bytes_parsed)
+        return [result]
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(task): i for i, (_, task) in enumerate(tasks)}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                progress.update(n_bytes=tasks[i][0])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def with_contexts(graph: ConjunctiveGraph, quads, contexts: dict):
+    """``quads`` with each graph name replaced by its context in ``graph``
+
+    ``contexts`` caches the contexts by name; ``None`` must already be there.
+    """
+    for s, p, o, name in quads:
+        context = contexts.get(name)
+        if context is None:
+            context = contexts[name] = graph.get_context(name)
+        yield s, p, o, context
+
+
+def merge_parsed(
+    identifiers,
+    results,
+    store: str = "Memory",
+    configuration: str = None,
+    batch_size: int = 10000,
+    progress: LoadProgress = None,
+    compact: bool = False,
+) -> tuple:
+    """add each parsed result to the named graph of its identifier
+
+    Quads keep the named graph they were parsed in (e.g. from N-Quads or
+    TriG); only statements outside any named graph go to the identifier's.
+
+    A persistent store is opened as it is: the named graphs of these files are
+    cleared first, and those of other files kept.
+
+    Returns ``(graph, stats, table)``. The GraphStats count every triple once,
+    however many files it appears in, as ``GraphStats.from_graph`` does. When
+    ``compact``, the triples go into a TripleTable instead, and the graph is
+    left empty.
+    """
+    graph = open_graph(store, configuration)
+    if compact:
+        table = TripleTable.from_triples(
+            quad[:3] for quad in chain.from_iterable(quads for quads, _ in results)
+        )
+        stats = table.stats()
+        stats.identifier = graph.identifier
+        progress = progress or LoadProgress()
+        progress.update(n_triples=len(table))
+        return graph, stats, table
+
+    # a persistent store may still hold earlier loads: drop what they left in
+    # the graphs of these files, so a reload does not keep deleted triples
+    preloaded = configuration is not None and len(graph) > 0
+    if preloaded:
+        names = {quad[3] for quads, _ in results for quad in quads}
+        names.discard(None)
+        for identifier in dict.fromkeys([*identifiers, *names]):
+            graph.remove((None, None, None, graph.get_context(identifier)))
+    stats = GraphStats(identifier=graph.identifier)
+    # the triples of earlier results, to take repeats back out of the stats
+    seen = set() if len(results) > 1 else None
+    contexts = {}
+    for identifier, (quads, file_stats) in zip(identifiers, results):
+        contexts[None] = graph.get_context(identifier)
+        add_in_batches(
+            graph, with_contexts(graph, quads, contexts), batch_size, progress
+        )
+        stats.merge(file_stats)
+        if seen is not None:
+            for triple in {quad[:3] for quad in quads}:
+                if triple in seen:
+                    stats.remove(triple)
+                else:
+                    seen.add(triple)
+    if preloaded:
+        # the graph also holds the other files of earlier loads
+        stats = GraphStats.from_graph(graph)
+    return graph, stats, None
+
+
+def parse_files(
+    files: dict,
+    max_workers: int = None,
+    store: str = "Memory",
+    configuration: str = None,
+    batch_size: int = 10000,
+    cache: ParseCache = None,
+    progress: LoadProgress = None,
+    compact: bool = False,
+) -> tuple:
+    """parse ``{file_name: content}`` into one graph per file, in parallel
+
+    Each file ends up in its own named graph of the returned ConjunctiveGraph,
+    which is backed by ``store`` (see ``open_graph``).
+    Files already in ``cache`` are read back rather than parsed. Large
+    N-Triples/N-Quads files are parsed in chunks, see ``file_tasks``.
+    Work done so far is reported to (and can be cancelled through) ``progress``.
+    Returns ``(graph, stats, table)``, see ``merge_parsed``.
+    """
+    identifiers, tasks = [], []
+    for file_name, content in files.items():
+        content_tasks = file_tasks(file_name, content, max_workers, cache)
+        identifiers += [file_identifier(file_name)] * len(content_tasks)
+        tasks += content_tasks
+    results = run_tasks(tasks, max_workers, progress)
+    if cache is not None:
+        cache.evict()
+    return merge_parsed(
+        identifiers, results, store, configuration, batch_size, progress, compact
+    )
+
+
+def parse_paths(
+    paths: list,
+    max_workers: int = None,
+    store: str = "Memory",
+    configuration: str = None,
+    batch_size: int = 10000,
+    progress: LoadProgress = None,
+    compact: bool = False,
+) -> tuple:
+    """parse files on the kernel host into one graph per file, in parallel
+
+    See ``parse_files``; each named graph is identified by the file's URI.
+    N-Triples/N-Quads files are further split into chunks at line boundaries,
+    which are parsed in parallel straight out of a memory-mapped file.
+    """
+    identifiers, tasks = [], []
+    for path in map(str, paths):
+        if Path(path).suffix.lower() in MMAP_SUFFIXES:
+            path_tasks = chunk_tasks(path, guess_file_format(path), max_workers)
+        else:
+            path_tasks = [(Path(path).stat().st_size, partial(parse_path, path))]
+        identifiers += [path_identifier(path)] * len(path_tasks)
+        tasks += path_tasks
+    results = run_tasks(tasks, max_workers, progress)
+    return merge_parsed(
+        identifiers, results, store, configuration, batch_size, progress, compact
+    )
@@ -0,0 +1,91 @@
+""" progress reporting and cancellation for background loads
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import io
+import threading
+
+# report bytes read at most this often, rather than on every read
+REPORT_BYTES = 2 ** 20
+
+
+class LoadCancelled(Exception):
+    """raised inside a load once it has been cancelled"""
+
+
+class LoadProgress:
+    """Bytes parsed and triples merged so far by one load, plus its cancel flag.
+
+    The parsing functions call ``update`` between units of work (a parsed file
+    or chunk, a merged batch), which is also where a cancelled load stops. A
+    file parsed in the loading thread itself reports (and stops) as it is read,
+    through a ProgressReader.
+
+    :param bytes_total: the number of input bytes the load will parse.
+    :param callback: called with this object after every update.
+    """
+
+    def __init__(self, bytes_total: int = 0, callback=None):
+        self.bytes_total = bytes_total
+        self.bytes_parsed = 0
+        self.n_triples = 0
+        self.callback = callback
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+
+    def update(self, n_bytes: int = 0, n_triples: int = 0):
+        self.bytes_parsed += n_bytes
+        self.n_triples += n_triples
+        if self.callback is not None:
+            self.callback(self)
+        self.check()
+
+
+class ProgressReader(io.RawIOBase):
+    """a binary file that reports the bytes read from ``raw`` to ``progress``
+
+    Every read checks whether the load was cancelled, so it stops from inside
+    the parser rather than once the whole file is parsed. At most ``n_bytes``
+    are reported, as a seekable file (e.g. a zip archive) may be read more than
+    once in places.
+    """
+
+    def __init__(self, raw, progress: LoadProgress, n_bytes: int):
+        self.raw = raw
+        self.progress = progress
+        self.remaining = n_bytes
+        self.pending = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.raw.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def readinto(self, buffer):
+        self.progress.check()
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.pending += min(size, self.remaining - self.pending)
+        if self.pending >= REPORT_BYTES or (self.pending and not size):
+            self.flush_progress()
+        return size
+
+    def flush_progress(self):
+        self.remaining -= self.pending
+        n_bytes, self.pending = self.pending, 0
+        self.progress.update(n_bytes=n_bytes)
@@ -0,0 +1,280 @@
+""" a text index of the entities of a graph
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from functools import partial
+from itertools import islice
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDFS, SKOS
+
+from .stats import _decrement
+
+# the predicates whose literal objects name their subject
+LABEL_PREDICATES = {RDFS.label, SKOS.prefLabel}
+
+# where the local name of an IRI starts
+LOCAL_NAME = re.compile(r"[^#/:]*$")
+
+
+def trigrams(key: str) -> set:
+    return {key[i : i + 3] for i in range(len(key) - 2)}
+
+
+def match_order(key: str) -> tuple:
+    return (len(key), key)
+
+
+def count_value(mapping: dict, key, value):
+    """count ``value`` under ``key``
+
+    Most keys only ever hold one value once, so a lone value is kept as it is,
+    and only a key given more values (or one value again) holds a Counter.
+    """
+    held = mapping.get(key)
+    if held is None:
+        mapping[key] = value
+    elif isinstance(held, Counter):
+        held[value] += 1
+    else:
+        mapping[key] = Counter([held, value])
+
+
+def discount_value(mapping: dict, key, value) -> bool:
+    """undo a ``count_value``; True once nothing is left under ``key``"""
+    held = mapping.get(key)
+    if isinstance(held, Counter):
+        if value not in held:
+            return False
+        _decrement(held, value)
+        if held:
+            return False
+    elif held is None or held != value:
+        return False
+    del mapping[key]
+    return True
+
+
+def counted_values(held) -> list:
+    """the values counted under a key, sorted"""
+    return sorted(held) if isinstance(held, Counter) else [held]
+
+
+class EntityIndex:
+    """IRIs and labels of a graph, searchable by prefix or by substring.
+
+    Each IRI is found by its local name and the labels it has, and by its full
+    text, all lowercased. Local names and labels are kept sorted for prefix
+    lookups, and indexed by trigram to find them by any part of three
+    characters or more. Full IRIs, which would cost the most to index, are
+    split into their namespace, of which a graph has few, and their local
+    name: text found in a namespace, or running from its end into a local
+    name, matches the IRIs of that namespace. Like GraphStats, the index is
+    kept up to date with ``add``/``remove`` rather than rebuilt.
+
+    An index made with a ``source`` is only built the first time it is used:
+    until then, changes are left to the source to report.
+
+    :param triples: the triples to index.
+    :param identifier: the identifier of the graph indexed.
+    :param source: a callable giving the triples to index on first use.
+    """
+
+    def __init__(self, triples=None, identifier=None, source=None):
+        self.identifier = identifier
+        self.source = source
+        # how many indexed triples mention each IRI
+        self.refs = Counter()
+        # IRI -> its label, or a Counter of its labels (see count_value)
+        self.labels = {}
+        # key -> the IRI given the key, or a Counter of IRIs
+        self.postings = {}
+        self.keys = []
+        self.grams = defaultdict(set)
+        # lowercased namespace -> its IRI, or a Counter of its IRIs
+        self.namespaces = {}
+        # whether new keys are inserted in order, or sorted after a bulk update
+        self.insort = True
+        self.lock = threading.RLock()
+        if triples is not None:
+            self.update(triples)
+
+    @classmethod
+    def from_graph(cls, graph: Graph):
+        """an index of ``graph``, built on first use"""
+        return cls(
+            identifier=graph.identifier,
+            source=partial(graph.triples, (None, None, None)),
+        )
+
+    def build(self):
+        """index the triples of the source, if not done yet"""
+        with self.lock:
+            if self.source is None:
+                return
+            source, self.source = self.source, None
+            self.update(source())
+
+    def __len__(self):
+        self.build()
+        return len(self.refs)
+
+    def add(self, triple):
+        s, p, o = triple
+        with self.lock:
+            if self.source is not None:
+                return
+            for term in (s, p, o):
+                if isinstance(term, URIRef):
+                    self.refs[term] += 1
+                    if self.refs[term] == 1:
+                        namespace, local_name = self.split(term)
+                        count_value(self.namespaces, namespace, term)
+                        self.add_key(local_name, term)
+            if (
+                p in LABEL_PREDICATES
+                and isinstance(o, Literal)
+                and isinstance(s, URIRef)
+            ):
+                count_value(self.labels, s, str(o))
+                self.add_key(str(o).lower(), s)
+
+    def remove(self, triple):
+        s, p, o = triple
+        with self.lock:
+            if self.source is not None:
+                return
+            if p in LABEL_PREDICATES and isinstance(o, Literal) and s in self.labels:
+                discount_value(self.labels, s, str(o))
+                self.remove_key(str(o).lower(), s)
+            for term in (s, p, o):
+                if isinstance(term, URIRef) and term in self.refs:
+                    _decrement(self.refs, term)
+                    if term not in self.refs:
+                        namespace, local_name = self.split(term)
+                        discount_value(self.namespaces, namespace, term)
+                        self.remove_key(local_name, term)
+
+    def update(self, triples):
+        """add many triples, sorting the new keys once at the end"""
+        with self.lock:
+            self.insort = False
+            try:
+                for triple in triples:
+                    self.add(triple)
+            finally:
+                self.keys.sort()
+                self.insort = True
+
+    def split(self, term: URIRef) -> tuple:
+        """the lowercased namespace and local name of an IRI"""
+        iri = str(term).lower()
+        start = LOCAL_NAME.search(iri).start()
+        return iri[:start], iri[start:]
+
+    def add_key(self, key: str, term: URIRef):
+        if not key:
+            return
+        if key not in self.postings:
+            if self.insort:
+                insort(self.keys, key)
+            else:
+                self.keys.append(key)
+            for gram in trigrams(key):
+                self.grams[gram].add(key)
+        count_value(self.postings, key, term)
+
+    def remove_key(self, key: str, term: URIRef):
+        if not discount_value(self.postings, key, term):
+            return
+        del self.keys[bisect_left(self.keys, key)]
+        for gram in trigrams(key):
+            keys = self.grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.grams[gram]
+
+    def label(self, term: URIRef) -> str:
+        """the most used label of ``term``, or None"""
+        self.build()
+        labels = self.labels.get(term)
+        if isinstance(labels, Counter):
+            return labels.most_common(1)[0][0]
+        return labels
+
+    def search(self, text: str, limit: int = 10) -> list:
+        """Up to ``limit`` IRIs matching ``text``, case-insensitively.
+
+        IRIs with a local name or label that starts with ``text`` come first,
+        in key order; then those with a local name or label that contains it,
+        shortest first; then those with a full IRI that contains it. Text too
+        short to hold a trigram is only found inside a namespace, or at the
+        start of a local name or label.
+        """
+        text = text.strip().lower()
+        found = {}
+        if not text or limit <= 0:
+            return []
+        self.build()
+        with self.lock:
+            keys = self.keys
+            for i in range(bisect_left(keys, text), len(keys)):
+                if len(found) >= limit or not keys[i].startswith(text):
+                    break
+                self.collect(keys[i], found)
+            if len(found) < limit and len(text) >= 3:
+                postings = [self.grams.get(gram, ()) for gram in trigrams(text)]
+                candidates = min(postings, key=len)
+                matches = [key for key in candidates if text in key]
+                # the shortest keys usually fill the limit, without a full sort
+                keys = heapq.nsmallest(limit, matches, key=match_order)
+                self.collect_all(keys, found, limit)
+                if len(found) < limit and len(keys) < len(matches):
+                    keys = sorted(matches, key=match_order)
+                    self.collect_all(keys, found, limit)
+            if len(found) < limit:
+                self.collect_iris(text, found, limit)
+        return list(found)[:limit]
+
+    def collect_iris(self, text: str, found: dict, limit: int):
+        """collect the IRIs with ``text`` in their namespace, or across its end"""
+        for namespace, held in self.namespaces.items():
+            if len(found) >= limit:
+                return
+            if text in namespace:
+                terms = held if isinstance(held, Counter) else [held]
+                for term in islice(terms, limit - len(found)):
+                    found.setdefault(term, None)
+                continue
+            # every end of the namespace that ``text`` starts with
+            for size in range(min(len(namespace), len(text) - 1), 0, -1):
+                if namespace.endswith(text[:size]):
+                    self.collect_local(namespace, text[size:], found, limit)
+
+    def collect_local(self, namespace: str, start: str, found: dict, limit: int):
+        """collect the IRIs of ``namespace`` with a local name that starts
+        with ``start``"""
+        keys = self.keys
+        for i in range(bisect_left(keys, start), len(keys)):
+            if len(found) >= limit or not keys[i].startswith(start):
+                return
+            for term in counted_values(self.postings[keys[i]]):
+                if self.split(term) == (namespace, keys[i]):
+                    found.setdefault(term, None)
+
+    def collect_all(self, keys: list, found: dict, limit: int):
+        for key in keys:
+            if len(found) >= limit:
+                break
+            self.collect(key, found)
+
+    def collect(self, key: str, found: dict):
+        for term in counted_values(self.postings[key]):
+            found.setdefault(term, None)
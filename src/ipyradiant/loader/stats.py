@@ -0,0 +1,91 @@
+""" single-pass graph statistics
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import Counter
+
+from rdflib import Graph
+from rdflib.namespace import RDF
+
+
+class GraphStats:
+    """Triple, term, predicate and class counts gathered in a single pass.
+
+    The counters are kept up to date with ``add``/``remove``, so a graph never
+    has to be re-scanned to refresh its statistics.
+    """
+
+    def __init__(self, triples=None, identifier=None):
+        self.identifier = identifier
+        self.n_triples = 0
+        self.subjects = Counter()
+        self.predicates = Counter()
+        self.objects = Counter()
+        self.classes = Counter()
+        if triples is not None:
+            self.update(triples)
+
+    @classmethod
+    def from_graph(cls, graph: Graph):
+        return cls(graph.triples((None, None, None)), identifier=graph.identifier)
+
+    @property
+    def n_subjects(self):
+        return len(self.subjects)
+
+    @property
+    def n_predicates(self):
+        return len(self.predicates)
+
+    @property
+    def n_objects(self):
+        return len(self.objects)
+
+    @property
+    def n_classes(self):
+        return len(self.classes)
+
+    def add(self, triple):
+        s, p, o = triple
+        self.n_triples += 1
+        self.subjects[s] += 1
+        self.predicates[p] += 1
+        self.objects[o] += 1
+        if p == RDF.type:
+            self.classes[o] += 1
+
+    def remove(self, triple):
+        s, p, o = triple
+        self.n_triples -= 1
+        _decrement(self.subjects, s)
+        _decrement(self.predicates, p)
+        _decrement(self.objects, o)
+        if p == RDF.type:
+            _decrement(self.classes, o)
+
+    def update(self, triples):
+        """add many triples"""
+        for _ in self.count(triples):
+            pass
+
+    def count(self, triples):
+        """add each triple as it streams past, passing it through unchanged"""
+        for triple in triples:
+            self.add(triple)
+            yield triple
+
+    def merge(self, other: "GraphStats"):
+        """fold the counts of ``other`` into these stats"""
+        self.n_triples += other.n_triples
+        self.subjects.update(other.subjects)
+        self.predicates.update(other.predicates)
+        self.objects.update(other.objects)
+        self.classes.update(other.classes)
+        return self
+
+
+def _decrement(counter: Counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
@@ -0,0 +1,142 @@
+""" a dictionary-encoded integer triple table
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import Counter
+
+import numpy as np
+from rdflib import Literal
+from rdflib.namespace import RDF
+
+from .stats import GraphStats
+
+# which sorted copy answers a pattern, by the positions (s=0, p=1, o=2) bound in it
+ORDERS = {
+    (): "spo",
+    (0,): "spo",
+    (0, 1): "spo",
+    (0, 1, 2): "spo",
+    (1,): "pos",
+    (1, 2): "pos",
+    (2,): "osp",
+    (0, 2): "osp",
+}
+# the column sequence each copy is sorted by
+ORDER_COLUMNS = {"spo": (0, 1, 2), "pos": (1, 2, 0), "osp": (2, 0, 1)}
+
+
+class TripleTable:
+    """Triples as integer ids into a term dictionary, sorted three ways.
+
+    Each distinct term is held once in ``terms``; every triple is a row of
+    three ids, kept in copies sorted by SPO, POS and OSP so any pattern with
+    bound terms is a binary search. With int32 ids the rows cost 36 bytes per
+    triple (3 orders x 3 columns x 4 bytes), i.e. ~34 MiB per million triples
+    plus the distinct terms, against several hundred bytes per triple for
+    rdflib's in-memory store.
+
+    :param terms: the term dictionary; a term's id is its index.
+    :param spo: an ``(n, 3)`` array of distinct (s, p, o) id rows.
+    """
+
+    def __init__(self, terms: list, spo: np.ndarray):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.spo = spo[np.lexsort((spo[:, 2], spo[:, 1], spo[:, 0]))]
+        self.pos = spo[np.lexsort((spo[:, 0], spo[:, 2], spo[:, 1]))]
+        self.osp = spo[np.lexsort((spo[:, 1], spo[:, 0], spo[:, 2]))]
+
+    @classmethod
+    def from_triples(cls, triples):
+        term_ids = {}
+        terms = []
+
+        def intern(term):
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(terms)
+                terms.append(term)
+            return term_id
+
+        ids = np.fromiter(
+            (intern(term) for triple in triples for term in triple), dtype=np.int64
+        )
+        dtype = np.int32 if len(terms) < 2 ** 31 else np.int64
+        spo = np.unique(ids.astype(dtype).reshape(-1, 3), axis=0)
+        return cls(terms, spo)
+
+    @classmethod
+    def from_graph(cls, graph):
+        return cls.from_triples(graph.triples((None, None, None)))
+
+    def __len__(self):
+        return len(self.spo)
+
+    @property
+    def nbytes(self):
+        """bytes held by the id arrays (the term dictionary is not included)"""
+        return self.spo.nbytes + self.pos.nbytes + self.osp.nbytes
+
+    def term_id(self, term):
+        return self.term_ids.get(term)
+
+    def find(self, pattern) -> np.ndarray:
+        """the ``(n, 3)`` id rows matching an (s, p, o) pattern; None is a wildcard"""
+        bound = tuple(i for i, term in enumerate(pattern) if term is not None)
+        ids = [self.term_id(pattern[i]) for i in bound]
+        if None in ids:
+            return self.spo[:0]
+        order = ORDERS[bound]
+        rows = getattr(self, order)
+        lo, hi = 0, len(rows)
+        for column in ORDER_COLUMNS[order][: len(bound)]:
+            value = ids[bound.index(column)]
+            values = rows[lo:hi, column]
+            lo, hi = (
+                lo + np.searchsorted(values, value, "left"),
+                lo + np.searchsorted(values, value, "right"),
+            )
+        return rows[lo:hi]
+
+    def triples(self, pattern=(None, None, None)):
+        """yield the rdflib terms of every triple matching ``pattern``"""
+        terms = self.terms
+        for s, p, o in self.find(pattern).tolist():
+            yield terms[s], terms[p], terms[o]
+
+    def literal_mask(self) -> np.ndarray:
+        """a boolean per term id, True for literals"""
+        return np.fromiter(
+            (isinstance(term, Literal) for term in self.terms),
+            dtype=bool,
+            count=len(self.terms),
+        )
+
+    def edges(self) -> np.ndarray:
+        """the id rows that link two nodes: no rdf:type, no literal objects"""
+        spo = self.spo
+        mask = ~self.literal_mask()[spo[:, 2]]
+        type_id = self.term_id(RDF.type)
+        if type_id is not None:
+            mask &= spo[:, 1] != type_id
+        return spo[mask]
+
+    def counts(self, ids: np.ndarray) -> Counter:
+        unique, counts = np.unique(ids, return_counts=True)
+        return Counter(
+            {self.terms[i]: n for i, n in zip(unique.tolist(), counts.tolist())}
+        )
+
+    def stats(self) -> GraphStats:
+        """GraphStats counted straight from the id columns"""
+        stats = GraphStats()
+        spo = self.spo
+        stats.n_triples = len(spo)
+        stats.subjects = self.counts(spo[:, 0])
+        stats.predicates = self.counts(spo[:, 1])
+        stats.objects = self.counts(spo[:, 2])
+        type_id = self.term_id(RDF.type)
+        if type_id is not None:
+            stats.classes = self.counts(spo[spo[:, 1] == type_id, 2])
+        return stats
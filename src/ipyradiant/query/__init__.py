@@ -3,5 +3,15 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
-__all__ = ["QueryWidget"]
+__all__ = [
+    "BatchRunner",
+    "EntityCombobox",
+    "NamespaceCollapser",
+    "QueryWidget",
+    "SPARQLEndpoint",
+]
+from .batch import BatchRunner
+from .endpoint import SPARQLEndpoint
+from .entity_search import EntityCombobox
+from .namespace_manager import NamespaceCollapser
 from .query_widget import QueryWidget
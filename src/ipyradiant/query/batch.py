@@ -0,0 +1,149 @@
+""" headless evaluation of many queries at once
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rdflib import Graph
+
+from .cache import PreparedQueryCache
+from .endpoint import SPARQLEndpoint
+from .execution import QueryCancelled, QueryExecution
+from .namespace_manager import NS_PATTERN
+from .profile import QueryProfile
+from .results import arrow_table, import_pyarrow
+
+
+class BatchResult:
+    """The outcome of one query of a batch.
+
+    ``seconds`` holds the time of each phase (see ``profile.PHASES``) and
+    ``elapsed`` the evaluation's wall time. A query that failed has its
+    ``error``; one that timed out keeps the SELECT rows found so far.
+
+    :param query: the query text.
+    :param init_bindings: the values its variables were bound to.
+    """
+
+    def __init__(self, query: str, init_bindings: dict = None):
+        self.query = query
+        self.init_bindings = init_bindings or {}
+        self.dataframe = None
+        self.table = None
+        self.seconds = {}
+        self.elapsed = 0.0
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        rows = None if self.dataframe is None else len(self.dataframe)
+        status = "ok" if self.ok else repr(self.error)
+        return f"<BatchResult {rows} rows in {self.elapsed:.3f}s: {status}>"
+
+
+class BatchRunner:
+    """Evaluate many queries against one graph in a pool of worker threads.
+
+    Nothing here needs a widget: queries are prepared once in the calling
+    thread, then evaluated concurrently. Pass a QueryWidget's
+    ``prepared_queries`` to share the queries it already parsed. rdflib
+    evaluates in pure Python, so local queries still take turns on the
+    interpreter lock; queries to an endpoint overlap fully.
+
+    :param graph: the graph to query.
+    :param namespaces: ``PREFIX`` lines, as the namespace manager holds them.
+    :param max_workers: how many queries to evaluate at a time.
+    :param endpoint: a SPARQLEndpoint to query instead of the graph.
+    :param timeout: seconds after which a query is stopped, if given.
+    :param arrow: also give each result as a pyarrow Table (needs pyarrow).
+    :param prepared_queries: the PreparedQueryCache to parse queries through.
+    """
+
+    def __init__(
+        self,
+        graph: Graph = None,
+        namespaces: str = "",
+        max_workers: int = 4,
+        endpoint: SPARQLEndpoint = None,
+        timeout: float = None,
+        arrow: bool = False,
+        prepared_queries: PreparedQueryCache = None,
+    ):
+        if graph is None and endpoint is None:
+            raise ValueError("A batch needs a graph or an endpoint to query.")
+        self.graph = graph
+        self.namespaces = namespaces
+        self.max_workers = max_workers
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.arrow = arrow
+        if arrow:
+            # fail now, rather than in every worker
+            import_pyarrow()
+        if prepared_queries is None:
+            prepared_queries = PreparedQueryCache()
+        self.prepared_queries = prepared_queries
+
+    def run(self, queries: list) -> list:
+        """a BatchResult for each of ``queries``, in the same order"""
+        return self.evaluate([(query, None) for query in queries])
+
+    def run_template(self, query: str, bindings: list) -> list:
+        """a BatchResult of ``query`` for each of ``bindings``, in the same order"""
+        return self.evaluate([(query, init_bindings) for init_bindings in bindings])
+
+    def evaluate(self, jobs: list) -> list:
+        results = []
+        executions = []
+        for query, init_bindings in jobs:
+            result = BatchResult(query, init_bindings)
+            results.append(result)
+            try:
+                executions.append(self.execution(query, init_bindings))
+            except Exception as error:
+                result.error = error
+                executions.append(None)
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            list(pool.map(self.run_execution, executions, results))
+        return results
+
+    def execution(self, query: str, init_bindings: dict = None) -> QueryExecution:
+        # parse here, in one thread: the prepared query cache is not locked
+        profile = QueryProfile()
+        if self.endpoint is not None:
+            if self.namespaces not in query:
+                query = f"{self.namespaces}\n{query}"
+            return QueryExecution(None, query, init_bindings, self.endpoint, profile)
+        init_ns = dict(NS_PATTERN.findall(self.namespaces))
+        prepared = self.prepared_queries.prepare(query, init_ns, profile)
+        return QueryExecution(self.graph, prepared, init_bindings, None, profile)
+
+    def run_execution(self, execution: QueryExecution, result: BatchResult):
+        if execution is None:
+            return
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, execution.stop, ("timed out",))
+            timer.daemon = True
+            timer.start()
+        try:
+            result.dataframe = execution.run()
+        except QueryCancelled:
+            result.dataframe = execution.partial
+            result.error = TimeoutError(
+                f"Stopped after {self.timeout}s with {len(result.dataframe)} rows."
+            )
+        except Exception as error:
+            result.error = error
+        finally:
+            if timer is not None:
+                timer.cancel()
+            result.seconds = dict(execution.profile.seconds)
+            result.elapsed = execution.elapsed
+        if self.arrow and result.dataframe is not None:
+            result.table = arrow_table(result.dataframe)
@@ -0,0 +1,176 @@
+""" bounded caches of prepared queries and their results
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import re
+from collections import OrderedDict
+
+from rdflib import Graph
+from rdflib.plugins.sparql.algebra import translateQuery
+from rdflib.plugins.sparql.parser import parseQuery
+from rdflib.plugins.sparql.sparql import Query
+from rdflib.plugins.stores.berkeleydb import BerkeleyDB
+from rdflib.store import TripleAddedEvent, TripleRemovedEvent
+
+from .profile import QueryProfile
+
+# stores known to report every removal; counting their triples takes a full scan
+REPORTED_REMOVALS = (BerkeleyDB,)
+
+# the tokens whose text may hold quotes, hashes or line breaks; of these, only
+# long (triple quoted) strings can span lines
+TOKENS = re.compile(
+    r"'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"""(?:[^"\\]|\\.|"(?!""))*"""'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r'|<[^<>"{}|^`\\\s]*>'
+    r"|#[^\n]*",
+    re.DOTALL,
+)
+LONG_QUOTES = ("'''", '"""')
+# a line break, with the indentation and blank lines around it
+LINE_BREAK = re.compile(r"[ \t\r]*\n\s*")
+
+
+def normalize_query(query: str) -> str:
+    """drop indentation and blank lines, which do not change a query's meaning
+
+    Long string literals are kept as they are, line breaks and all.
+    """
+    parts = []
+    end = 0
+    for match in TOKENS.finditer(query):
+        if match.group().startswith(LONG_QUOTES):
+            parts.append(LINE_BREAK.sub("\n", query[end : match.start()]))
+            parts.append(match.group())
+            end = match.end()
+    parts.append(LINE_BREAK.sub("\n", query[end:]))
+    return "".join(parts).strip()
+
+
+def namespace_key(init_ns: dict) -> tuple:
+    return tuple(sorted((prefix, str(uri)) for prefix, uri in init_ns.items()))
+
+
+def bindings_key(init_bindings: dict) -> tuple:
+    # keep the bound terms themselves: their text alone would conflate
+    # literals of different datatypes
+    return tuple(sorted((str(var), term) for var, term in init_bindings.items()))
+
+
+class LRUCache:
+    """The most recently used ``maxsize`` values, with hit and miss counts.
+
+    :param maxsize: the number of values kept.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class QueryResultCache(LRUCache):
+    """Query results for one graph.
+
+    Keys combine a graph version counter with the normalized query text and
+    its namespaces; every change to the watched graph bumps the version and
+    drops the cached results.
+
+    Stores report added triples, but not all report removals (rdflib's
+    Memory store does not), so unless the store is one of REPORTED_REMOVALS,
+    the graph's size is also checked whenever a key is made: between two
+    additions, removals can only shrink it.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        super().__init__(maxsize)
+        self.version = 0
+        self.graph = None
+        self.size = None
+        self.check_size = False
+
+    def watch(self, graph: Graph):
+        """invalidate whenever triples are added to or removed from ``graph``
+
+        Only one graph is watched at a time: the previous one is let go.
+        """
+        self.unwatch()
+        self.graph = graph
+        self.check_size = not isinstance(graph.store, REPORTED_REMOVALS)
+        dispatcher = graph.store.dispatcher
+        dispatcher.subscribe(TripleAddedEvent, self.invalidate)
+        dispatcher.subscribe(TripleRemovedEvent, self.invalidate)
+        self.invalidate()
+
+    def unwatch(self):
+        if self.graph is None:
+            return
+        handlers = self.graph.store.dispatcher.get_map() or {}
+        for event_type in (TripleAddedEvent, TripleRemovedEvent):
+            subscribed = handlers.get(event_type, [])
+            if self.invalidate in subscribed:
+                subscribed.remove(self.invalidate)
+        self.graph = None
+
+    def invalidate(self, event=None):
+        self.version += 1
+        self.size = None
+        self.entries.clear()
+
+    def check(self) -> int:
+        """the current version, bumped first if the graph shrank unreported"""
+        if self.graph is not None and self.check_size:
+            size = len(self.graph)
+            if self.size is not None and size != self.size:
+                self.invalidate()
+            self.size = size
+        return self.version
+
+    def key(self, query: str, init_ns: dict, init_bindings: dict = None) -> tuple:
+        return (
+            self.check(),
+            normalize_query(query),
+            namespace_key(init_ns),
+            bindings_key(init_bindings or {}),
+        )
+
+
+class PreparedQueryCache(LRUCache):
+    """Parsed and algebra-translated queries, keyed by their text and namespaces.
+
+    A prepared query does not depend on the graph, so these outlive reloads.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        super().__init__(maxsize)
+
+    def prepare(self, query: str, init_ns: dict, profile: QueryProfile = None) -> Query:
+        """the query parsed and translated, as rdflib's ``prepareQuery`` does"""
+        key = (normalize_query(query), namespace_key(init_ns))
+        prepared = self.get(key)
+        if prepared is None:
+            profile = profile or QueryProfile()
+            parsed = profile.call("parse", parseQuery, query)
+            prepared = profile.call("algebra", translateQuery, parsed, None, init_ns)
+            self.put(key, prepared)
+        return prepared
@@ -0,0 +1,267 @@
+""" a remote SPARQL 1.1 endpoint
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import http.client
+import io
+import json
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+
+from rdflib import BNode, Graph, Literal, URIRef, Variable
+from rdflib.namespace import XSD
+from rdflib.plugins.sparql.results.jsonresults import parseJsonTerm
+
+ACCEPT = {
+    "json": "application/sparql-results+json",
+    "tsv": "text/tab-separated-values",
+}
+GRAPH_ACCEPT = "application/n-triples"
+
+# the query form, once IRIs and comments are out of the way
+QUERY_FORM = re.compile(r"\b(SELECT|ASK|CONSTRUCT|DESCRIBE)\b", re.IGNORECASE)
+IRI_OR_COMMENT = re.compile(r"<[^>\s]*>|#[^\n]*")
+
+# a TSV literal: its quoted text, then an optional language or datatype
+TSV_LITERAL = re.compile(r'^"(.*)"(?:@([\w-]+)|\^\^<([^>]*)>)?$', re.DOTALL)
+TSV_ESCAPE = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))")
+TSV_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f"}
+
+# "bindings": [ in a streamed JSON result, and the variables of its head
+JSON_BINDINGS = re.compile(r'"bindings"\s*:\s*\[')
+JSON_VARS = re.compile(r'"vars"\s*:\s*(\[[^\]]*\])')
+
+
+class EndpointError(RuntimeError):
+    """an endpoint answered with something other than results"""
+
+
+def query_form(query: str) -> str:
+    match = QUERY_FORM.search(IRI_OR_COMMENT.sub("", query))
+    if match is None:
+        raise ValueError("Not a SELECT, ASK, CONSTRUCT or DESCRIBE query.")
+    return match.group(1).upper()
+
+
+def add_values(query: str, init_bindings: dict) -> str:
+    """bind variables of a query the remote way, with a trailing VALUES clause"""
+    if not init_bindings:
+        return query
+    variables = " ".join(f"?{var}" for var in init_bindings)
+    terms = " ".join(term.n3() for term in init_bindings.values())
+    return f"{query}\nVALUES ({variables}) {{ ({terms}) }}"
+
+
+def unescape_tsv(text: str) -> str:
+    def replace(match):
+        code = match.group(1) or match.group(2)
+        if code:
+            return chr(int(code, 16))
+        return TSV_ESCAPES.get(match.group(3), match.group(3))
+
+    return TSV_ESCAPE.sub(replace, text)
+
+
+def parse_tsv_term(text: str):
+    """an rdflib term from its SPARQL TSV form; None when unbound"""
+    if not text:
+        return None
+    if text[0] == "<":
+        return URIRef(text[1:-1])
+    if text.startswith("_:"):
+        return BNode(text[2:])
+    match = TSV_LITERAL.match(text)
+    if match:
+        value, lang, datatype = match.groups()
+        return Literal(unescape_tsv(value), lang=lang, datatype=datatype)
+    if text in ("true", "false"):
+        return Literal(text, datatype=XSD.boolean)
+    if "e" in text or "E" in text:
+        return Literal(text, datatype=XSD.double)
+    if "." in text:
+        return Literal(text, datatype=XSD.decimal)
+    return Literal(text, datatype=XSD.integer)
+
+
+def iter_tsv(stream: io.TextIOBase):
+    """yield the variables of a TSV result, then one solution dict per row"""
+    variables = [Variable(name.strip()[1:]) for name in stream.readline().split("\t")]
+    yield variables
+    for line in stream:
+        line = line.rstrip("\r\n")
+        yield {
+            var: term
+            for var, term in zip(variables, map(parse_tsv_term, line.split("\t")))
+            if term is not None
+        }
+
+
+def iter_json(stream: io.TextIOBase, chunk_size: int = 2 ** 16):
+    """yield the variables of a JSON result, then one solution dict per binding
+
+    Bindings are decoded one at a time as the text arrives, so memory does not
+    grow with the size of the response.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    match = None
+    while match is None:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        match = JSON_BINDINGS.search(buffer)
+        if not chunk and match is None:
+            raise EndpointError("The response holds no bindings.")
+    head = JSON_VARS.search(buffer, 0, match.start())
+    if head is None:
+        # no head before the bindings: read it all instead of streaming
+        result = json.loads(buffer + stream.read())
+        variables = [Variable(var) for var in result["head"]["vars"]]
+        yield variables
+        for binding in result["results"]["bindings"]:
+            yield {Variable(k): parseJsonTerm(v) for k, v in binding.items()}
+        return
+    yield [Variable(var) for var in json.loads(head.group(1))]
+    buffer = buffer[match.end() :]
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if buffer[pos : pos + 1] == "]":
+            return
+        try:
+            binding, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield {Variable(k): parseJsonTerm(v) for k, v in binding.items()}
+
+
+class SPARQLEndpoint:
+    """A SPARQL 1.1 query endpoint, reached over reused keep-alive connections.
+
+    ``evaluate`` answers in the shape of rdflib's ``evalQuery``, with SELECT
+    solutions parsed from the response as they are read.
+
+    :param url: the endpoint URL.
+    :param result_format: ``json`` or ``tsv``, the SELECT results requested.
+    :param timeout: seconds to wait on the socket.
+    :param max_idle: how many idle connections to keep open.
+    :param headers: extra HTTP headers, e.g. for authorization.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        result_format: str = "json",
+        timeout: float = 60.0,
+        max_idle: int = 4,
+        headers: dict = None,
+    ):
+        if result_format not in ACCEPT:
+            raise ValueError(f"Unknown result format: {result_format}")
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Not an http(s) URL: {url}")
+        self.url = url
+        self.result_format = result_format
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.headers = headers or {}
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += f"?{parts.query}"
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    @contextmanager
+    def response(self, query: str, accept: str):
+        """POST ``query``, yielding the response on a pooled connection
+
+        The connection goes back to the pool only if the response was read to
+        the end; one the server has closed meanwhile is retried once afresh.
+        """
+        body = urlencode({"query": query})
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": accept,
+            **self.headers,
+        }
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        reused = conn is not None
+        while True:
+            conn = conn or self.connect()
+            try:
+                conn.request("POST", self.path, body, headers)
+                response = conn.getresponse()
+            except ConnectionError:
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = None, False
+                continue
+            break
+        try:
+            if response.status != 200:
+                raise EndpointError(
+                    f"{self.url} answered {response.status} {response.reason}: "
+                    + response.read(2000).decode("utf-8", "replace")
+                )
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        if response.isclosed() and not response.will_close:
+            with self.lock:
+                if len(self.idle) < self.max_idle:
+                    self.idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        """close the idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def evaluate(self, query: str, init_bindings: dict = None) -> dict:
+        """the result of ``query``, as rdflib's ``evalQuery`` would give it"""
+        query = add_values(query, init_bindings)
+        form = query_form(query)
+        if form in ("CONSTRUCT", "DESCRIBE"):
+            with self.response(query, GRAPH_ACCEPT) as response:
+                graph = Graph()
+                graph.parse(data=response.read(), format="nt")
+            return {"type_": form, "graph": graph}
+        if form == "ASK":
+            with self.response(query, ACCEPT["json"]) as response:
+                answer = json.load(response)["boolean"]
+            return {"type_": form, "askAnswer": answer}
+        solutions = self.solutions(query)
+        return {"type_": form, "vars_": next(solutions), "bindings": solutions}
+
+    def solutions(self, query: str):
+        """yield the variables of a SELECT query, then its solutions as they arrive"""
+        with self.response(query, ACCEPT[self.result_format]) as response:
+            stream = io.TextIOWrapper(response, encoding="utf-8", newline="")
+            if self.result_format == "tsv":
+                yield from iter_tsv(stream)
+            else:
+                yield from iter_json(stream)
+            # read what follows the bindings, so the connection can be reused
+            stream.read()
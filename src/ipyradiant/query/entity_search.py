@@ -0,0 +1,56 @@
+""" a text box that suggests entities as it is typed in
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import traitlets as T
+
+import ipywidgets as W
+from rdflib import URIRef
+
+from ..loader.search import EntityIndex
+from .namespace_manager import NamespaceCollapser
+
+
+class EntityCombobox(W.Combobox):
+    """Suggests the IRIs of an EntityIndex that match the text typed so far.
+
+    Suggestions show each IRI collapsed, with its label; picking one sets
+    ``term``.
+
+    :param index: the EntityIndex to search.
+    :param collapser: a NamespaceCollapser to shorten the suggested IRIs.
+    :param limit: the most suggestions to offer at once.
+    :param term: the IRI picked last.
+    """
+
+    index = T.Instance(EntityIndex, allow_none=True)
+    collapser = T.Instance(NamespaceCollapser, allow_none=True)
+    limit = T.Int(default_value=10)
+    term = T.Instance(URIRef, allow_none=True)
+
+    def __init__(self, *args, **kwargs):
+        # suggestion text -> IRI, for the current options
+        self.choices = {}
+        kwargs.setdefault("ensure_option", False)
+        super().__init__(*args, **kwargs)
+
+    def suggestion(self, term: URIRef) -> str:
+        name = str(term)
+        if self.collapser is not None:
+            name = self.collapser.collapse(term)
+        label = self.index.label(term)
+        return f"{name} ({label})" if label else name
+
+    @T.observe("value")
+    def update_suggestions(self, change):
+        term = self.choices.get(change.new)
+        if term is not None:
+            self.term = term
+            return
+        if self.index is None:
+            found = []
+        else:
+            found = self.index.search(change.new, self.limit)
+        self.choices = {self.suggestion(term): term for term in found}
+        self.options = tuple(self.choices)
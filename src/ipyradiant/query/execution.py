@@ -0,0 +1,173 @@
+""" query evaluation that can be stopped part way
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import ctypes
+import threading
+import time
+
+from pandas import DataFrame
+from rdflib import Graph
+from rdflib.plugins.sparql.evaluate import evalQuery
+from rdflib.plugins.sparql.processor import SPARQLResult
+from rdflib.plugins.sparql.sparql import Query
+
+from .endpoint import SPARQLEndpoint
+from .profile import QueryProfile
+from .results import bindings_dataframe, result_dataframe
+
+# seconds between interrupts of a query that is still evaluating once stopped
+RETRY_INTERRUPT = 0.2
+
+
+class QueryCancelled(Exception):
+    """raised inside a query's evaluation once it has been stopped"""
+
+
+def interrupt_thread(ident: int, exc_type=None):
+    """raise ``exc_type`` in another thread, or clear a pending one if None"""
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(ident), None if exc_type is None else ctypes.py_object(exc_type)
+    )
+
+
+class QueryExecution:
+    """One evaluation of a prepared query, which another thread can stop.
+
+    SELECT solutions are collected as rdflib yields them, so a stopped query
+    still has the rows found so far. rdflib evaluates in pure Python, so
+    ``stop`` raises QueryCancelled straight inside the evaluating thread, even
+    in a join that has not produced a solution yet. An interrupt landing in a
+    finalizer or weakref callback is printed and dropped by Python, so it is
+    raised again until the evaluation stops.
+
+    :param graph: the graph to query.
+    :param query: a prepared query, or query text for an endpoint.
+    :param init_bindings: values for variables of the query.
+    :param endpoint: a SPARQLEndpoint to query instead of the graph.
+    :param profile: a QueryProfile to record the evaluation in.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        query: Query,
+        init_bindings: dict = None,
+        endpoint: SPARQLEndpoint = None,
+        profile: QueryProfile = None,
+    ):
+        self.graph = graph
+        self.endpoint = endpoint
+        self.profile = profile or QueryProfile()
+        self.query = query
+        self.init_bindings = init_bindings or {}
+        self.variables = []
+        self.bindings = []
+        self.dataframe = None
+        self.reason = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        # the evaluating thread, while it may be interrupted
+        self.ident = None
+        self.interrupted = False
+        self.retried = False
+        self.delivered = False
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def partial(self) -> DataFrame:
+        """the SELECT solutions collected so far"""
+        return bindings_dataframe(self.variables, self.bindings)
+
+    def stop(self, reason: str = "cancelled"):
+        with self.lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            if self.ident is None:
+                return
+            interrupt_thread(self.ident, QueryCancelled)
+            self.interrupted = True
+        threading.Thread(target=self.retry_interrupt, daemon=True).start()
+
+    def retry_interrupt(self):
+        while not self.done.wait(RETRY_INTERRUPT):
+            with self.lock:
+                if self.ident is None or self.delivered:
+                    return
+                interrupt_thread(self.ident, QueryCancelled)
+                self.retried = True
+
+    def run(self) -> DataFrame:
+        """evaluate in this thread, raising QueryCancelled if stopped first"""
+        self.started = time.monotonic()
+        try:
+            try:
+                with self.lock:
+                    if self.reason is None:
+                        self.ident = threading.get_ident()
+                if self.ident is not None:
+                    self.evaluate()
+            except QueryCancelled:
+                self.delivered = True
+            finally:
+                with self.lock:
+                    self.ident = None
+                    # only clear an interrupt that may still be pending: clearing
+                    # when there is none upsets a later cProfile in the thread
+                    if self.interrupted and (self.retried or not self.delivered):
+                        interrupt_thread(threading.get_ident())
+        except QueryCancelled:
+            # the interrupt landed after evaluation, before the lock above
+            pass
+        finally:
+            self.finished = time.monotonic()
+            self.done.set()
+        if self.dataframe is None:
+            raise QueryCancelled(self.reason)
+        return self.dataframe
+
+    def evaluate(self):
+        result = self.profile.call("evaluate", self.collect)
+        if result is None:
+            self.dataframe = self.profile.call(
+                "dataframe", bindings_dataframe, self.variables, self.bindings
+            )
+        else:
+            self.dataframe = self.profile.call(
+                "dataframe", result_dataframe, SPARQLResult(result)
+            )
+
+    def result(self) -> dict:
+        """the result, as rdflib's ``evalQuery`` gives it, with SELECT solutions
+        still to be iterated"""
+        if self.endpoint is not None:
+            return self.endpoint.evaluate(self.query, self.init_bindings)
+        return evalQuery(self.graph, self.query, self.init_bindings)
+
+    def collect(self):
+        """collect the solutions of a SELECT query, or return any other result"""
+        result = self.result()
+        if result.get("type_") != "SELECT":
+            return result
+        self.variables = result["vars_"]
+        append = self.bindings.append
+        solutions = result["bindings"]
+        try:
+            for solution in solutions:
+                # as rdflib's Result does, skip empty solutions
+                if solution:
+                    append(solution)
+        finally:
+            # a stopped endpoint query drops its half-read connection here
+            if hasattr(solutions, "close"):
+                solutions.close()
+        return None
@@ -0,0 +1,142 @@
+""" streaming export of query results to files
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import csv
+from itertools import islice
+from pathlib import Path
+
+from .results import import_pyarrow
+
+# the format written for each file suffix
+FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+
+def export_format(path, format: str = None) -> str:
+    if format is None:
+        format = FORMATS.get(Path(path).suffix.lower())
+        if format is None:
+            raise ValueError(f"Cannot tell the export format of {path}")
+    if format not in FORMATS.values():
+        raise ValueError(f"Unknown export format: {format}")
+    return format
+
+
+def result_rows(result: dict) -> tuple:
+    """the column names of an ``evalQuery``-shaped result, and an iterator of rows
+
+    Columns are named as in ``results.result_columns``.
+    """
+    if result["type_"] == "SELECT":
+        variables = result["vars_"]
+        rows = (
+            tuple(solution.get(var) for var in variables)
+            for solution in result["bindings"]
+            # as rdflib's Result does, skip empty solutions
+            if solution
+        )
+        return [str(var) for var in variables], rows
+    if result["type_"] == "ASK":
+        return ["ask"], iter([(result["askAnswer"],)])
+    return ["subject", "predicate", "object"], iter(result["graph"])
+
+
+class CSVWriter:
+    """rows of terms as CSV text, with unbound cells left empty"""
+
+    def __init__(self, path, names: list):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(names)
+
+    def write(self, rows: list):
+        self.writer.writerows(
+            ["" if term is None else str(term) for term in row] for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    """rows of terms as record batches of strings, with unbound cells as nulls
+
+    :param format: ``parquet``, or ``arrow`` for the Arrow IPC file format.
+    """
+
+    def __init__(self, path, names: list, format: str = "parquet"):
+        pa = self.pa = import_pyarrow()
+        self.schema = pa.schema([(name, pa.string()) for name in names])
+        if format == "parquet":
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(str(path), self.schema)
+            self.write_batch = self.write_parquet
+        else:
+            self.writer = pa.ipc.new_file(str(path), self.schema)
+            self.write_batch = self.writer.write_batch
+
+    def write(self, rows: list):
+        pa = self.pa
+        columns = list(zip(*rows)) or [()] * len(self.schema)
+        arrays = [
+            pa.array(
+                [None if term is None else str(term) for term in column],
+                type=pa.string(),
+            )
+            for column in columns
+        ]
+        self.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def write_parquet(self, batch):
+        self.writer.write_table(self.pa.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path, names: list, format: str):
+    if format == "csv":
+        return CSVWriter(path, names)
+    return ArrowWriter(path, names, format)
+
+
+def export_result(
+    result: dict, path, format: str = None, batch_size: int = 2 ** 16
+) -> int:
+    """Write a query result to ``path``, ``batch_size`` rows at a time.
+
+    ``result`` is shaped as rdflib's ``evalQuery`` (or an endpoint's
+    ``evaluate``) gives it, so SELECT solutions go to the file as they are
+    found, and only one batch is held at a time. Queries that rdflib has to
+    materialize to answer (e.g. ORDER BY) still do. The format follows the
+    suffix of ``path`` unless given: ``csv``, ``parquet`` or ``arrow``; the
+    last two need pyarrow. Returns the number of rows written.
+    """
+    format = export_format(path, format)
+    names, rows = result_rows(result)
+    bindings = result.get("bindings")
+    n_rows = 0
+    try:
+        writer = open_writer(path, names, format)
+        try:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                writer.write(batch)
+                n_rows += len(batch)
+        finally:
+            writer.close()
+    finally:
+        # drop a half-read endpoint response
+        if hasattr(bindings, "close"):
+            bindings.close()
+    return n_rows
@@ -17,19 +17,51 @@ default_ns = {
 }
 
 
-def collapse_namespace(namespaces, cell):
-    """TODO"""
-    uf_link = """<a href=\"{}" target=\"_blank\">{}</a>"""
+# namespace pattern
+NS_PATTERN = re.compile(r"PREFIX ([\w]*): <(.+)>")
+
+
+class NamespaceCollapser:
+    """Shortens URIs to ``prefix:name`` by their longest matching namespace.
+
+    Namespaces are indexed by length, so a lookup is one dict probe per
+    distinct namespace length, longest first; collapsed URIs are memoized.
+
+    :param namespaces: ``(prefix, namespace)`` pairs.
+    """
+
+    def __init__(self, namespaces):
+        self.namespaces = {str(uri): prefix for prefix, uri in namespaces}
+        self.lengths = sorted({len(uri) for uri in self.namespaces}, reverse=True)
+        self.memo = {}
+
+    @classmethod
+    def from_prefixes(cls, prefixes: str):
+        """build from SPARQL ``PREFIX`` declarations"""
+        return cls(NS_PATTERN.findall(prefixes))
 
-    or_statement = "|".join([uri for _, uri in namespaces])
-    pattern = f"({or_statement}).*"
-    quick_check = re.match(pattern, str(cell))
-    if quick_check:
-        for term, uri in namespaces:
-            if cell.startswith(uri):
-                return uf_link.format(cell, str(cell).replace(uri, term + ":"))
-    else:
-        return uf_link.format(cell, cell)
+    def collapse(self, uri) -> str:
+        """``uri`` as ``prefix:name``, or unchanged when no namespace matches"""
+        collapsed = self.memo.get(uri)
+        if collapsed is None:
+            collapsed = self.memo[uri] = self.match(str(uri))
+        return collapsed
+
+    def match(self, uri: str) -> str:
+        for length in self.lengths:
+            prefix = self.namespaces.get(uri[:length])
+            if prefix is not None:
+                return f"{prefix}:{uri[length:]}"
+        return uri
+
+    def link(self, uri) -> str:
+        """a link to ``uri`` labelled with its collapsed form"""
+        return f"""<a href=\"{uri}" target=\"_blank\">{self.collapse(uri)}</a>"""
+
+
+def collapse_namespace(namespaces, cell):
+    """a link to ``cell`` labelled by its longest matching namespace"""
+    return NamespaceCollapser(namespaces).link(cell)
 
 
 class NamespaceManager(W.VBox):
@@ -43,6 +75,7 @@ class NamespaceManager(W.VBox):
     user_namespaces = T.Instance(W.Textarea)
     user_namespaces_value = T.Unicode()
     namespaces = T.Unicode()
+    collapser = T.Instance(NamespaceCollapser)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -76,6 +109,14 @@ class NamespaceManager(W.VBox):
     def make_included_namespaces_value(self):
         return "\n".join([f"PREFIX {ns}: <{uri}>" for ns, uri in default_ns.items()])
 
+    @T.default("collapser")
+    def make_default_collapser(self):
+        return NamespaceCollapser.from_prefixes(self.namespaces)
+
+    @T.observe("namespaces")
+    def update_collapser(self, change):
+        self.collapser = NamespaceCollapser.from_prefixes(change.new)
+
     @T.observe("user_namespaces_value")
     def update_namespaces(self, changes):
         self.namespaces = "\n".join([self.included_namespaces_value, changes.new])
@@ -0,0 +1,113 @@
+""" selectivity-based ordering of basic graph patterns
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+
+from rdflib import BNode, Variable
+from rdflib.paths import Path
+from rdflib.plugins.sparql.parserutils import CompValue, Expr
+from rdflib.plugins.sparql.sparql import Query
+
+from ..loader.stats import GraphStats
+
+
+def is_variable(term) -> bool:
+    # blank nodes in a pattern match like variables
+    return isinstance(term, (Variable, BNode))
+
+
+def estimate_matches(pattern: tuple, bound: set, stats: GraphStats) -> float:
+    """the expected number of matches of a triple pattern
+
+    Each position is taken as independent: a fixed term scales the triple count
+    by its share of that position, a variable already ``bound`` by the average
+    share of one distinct term. Property paths are not estimated.
+    """
+    n_triples = stats.n_triples
+    if not n_triples:
+        return 0.0
+    counters = (stats.subjects, stats.predicates, stats.objects)
+    n_distinct = (stats.n_subjects, stats.n_predicates, stats.n_objects)
+    matches = float(n_triples)
+    for term, counter, distinct in zip(pattern, counters, n_distinct):
+        if isinstance(term, Path):
+            continue
+        if is_variable(term):
+            if term in bound:
+                matches /= max(1, distinct)
+        else:
+            matches *= counter.get(term, 0) / n_triples
+    return matches
+
+
+def order_patterns(triples: list, stats: GraphStats, bound: set = None) -> list:
+    """``(pattern, estimated matches)`` pairs, greedily cheapest first
+
+    After the first pattern, only patterns sharing a variable with those
+    already placed are candidates (while there are any), so the order does
+    not start a cross product it could avoid.
+    """
+    bound = set(bound or ())
+    remaining = list(triples)
+    ordered = []
+    while remaining:
+        estimates = [estimate_matches(pattern, bound, stats) for pattern in remaining]
+        joined = [
+            i
+            for i, pattern in enumerate(remaining)
+            if any(term in bound for term in pattern if is_variable(term))
+        ]
+        best = min(joined or range(len(remaining)), key=estimates.__getitem__)
+        pattern = remaining.pop(best)
+        ordered.append((pattern, estimates[best]))
+        bound.update(term for term in pattern if is_variable(term))
+    return ordered
+
+
+def reorder_query(query: Query, stats: GraphStats) -> tuple:
+    """A copy of a prepared query with every BGP ordered by estimated selectivity.
+
+    Only the nodes above a reordered BGP are copied, so ``query`` itself keeps
+    its written order. The patterns of an OPTIONAL are ordered knowing the
+    variables its required side binds; those inside filter expressions are
+    left as they are. Returns the copy, and the chosen order of each BGP as
+    ``(pattern, estimated matches)`` pairs.
+    """
+    orders = []
+
+    def walk(node, bound):
+        if isinstance(node, Expr):
+            return node
+        if isinstance(node, list):
+            items = [walk(item, bound) for item in node]
+            changed = any(new is not old for new, old in zip(items, node))
+            return items if changed else node
+        if not isinstance(node, CompValue):
+            return node
+        if node.name == "BGP":
+            ordered = order_patterns(node.triples, stats, bound)
+            orders.append(ordered)
+            node = node.clone()
+            node["triples"] = [pattern for pattern, _ in ordered]
+            return node
+        if node.name == "LeftJoin":
+            children = {
+                "p1": walk(node.p1, bound),
+                "p2": walk(node.p2, bound | set(node.p1._vars or ())),
+            }
+        else:
+            children = {key: walk(value, bound) for key, value in node.items()}
+        changed = {
+            key: value for key, value in children.items() if value is not node[key]
+        }
+        if not changed:
+            return node
+        node = node.clone()
+        node.update(changed)
+        return node
+
+    reordered = copy.copy(query)
+    reordered.algebra = walk(query.algebra, set())
+    return reordered, orders
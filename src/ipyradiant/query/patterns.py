@@ -0,0 +1,148 @@
+""" which triples can change the result of a query
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+from rdflib import Variable
+from rdflib.paths import Path
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.algebra import triples as block_triples
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.sparql import (
+    FrozenBindings,
+    Query,
+    QueryContext,
+    SPARQLError,
+)
+
+from .optimizer import is_variable
+
+# the parts of a pattern that the filters of the enclosing group do not
+# constrain one triple at a time: optional and negated parts, and subqueries
+UNFILTERED = {"LeftJoin": ("p2", "expr"), "Minus": ("p2",), "ToMultiSet": ("p",)}
+
+
+def conjuncts(expr) -> list:
+    """the expressions that must all hold for ``expr`` to hold"""
+    if isinstance(expr, CompValue) and expr.name == "ConditionalAndExpression":
+        return [item for part in [expr.expr, *expr.other] for item in conjuncts(part)]
+    return [expr]
+
+
+def expr_vars(expr) -> set:
+    """the variables of a filter expression, or None if it tests the graph"""
+    if isinstance(expr, Variable):
+        return {expr}
+    if isinstance(expr, list):
+        parts = expr
+    elif isinstance(expr, CompValue):
+        if expr.name.endswith("EXISTS"):
+            return None
+        parts = list(expr.values())
+    else:
+        return set()
+    found = set()
+    for part in parts:
+        part_vars = expr_vars(part)
+        if part_vars is None:
+            return None
+        found |= part_vars
+    return found
+
+
+def query_patterns(query: Query) -> list:
+    """The triple patterns of a prepared query, with the filters on each.
+
+    The filters of a pattern are the conjuncts of the FILTERs of its group,
+    which every solution using a triple matched by the pattern must pass, as
+    ``(expression, its variables)`` pairs.
+    """
+    patterns = []
+
+    def walk(node, filters):
+        if isinstance(node, list):
+            for item in node:
+                walk(item, filters)
+        if not isinstance(node, CompValue):
+            return
+        if node.name == "BGP":
+            patterns.extend((pattern, filters) for pattern in node.triples)
+        elif node.name == "TriplesBlock":
+            # the graph of an EXISTS is kept as parsed
+            patterns.extend((pattern, []) for pattern in block_triples(node.triples))
+        elif node.name == "Filter":
+            added = [(expr, expr_vars(expr)) for expr in conjuncts(node.expr)]
+            walk(node.p, filters + added)
+            # patterns of an EXISTS in the filter itself
+            walk(node.expr, [])
+        else:
+            unfiltered = UNFILTERED.get(node.name, ())
+            for key, value in node.items():
+                walk(value, [] if key in unfiltered else filters)
+
+    walk(query.algebra, [])
+    return patterns
+
+
+def bind(pattern: tuple, triple: tuple) -> dict:
+    """the variables of ``pattern`` bound by matching ``triple``, or None"""
+    if isinstance(pattern[1], (Path, CompValue)):
+        # a path may match the triple anywhere along it
+        return {}
+    bindings = {}
+    for term, value in zip(pattern, triple):
+        if not is_variable(term):
+            if term != value:
+                return None
+        elif bindings.setdefault(term, value) != value:
+            return None
+    return bindings
+
+
+def passes(expr, needed: set, bindings: dict, context: QueryContext) -> bool:
+    """whether a filter can let through a solution with ``bindings``"""
+    if needed is None or not needed <= bindings.keys():
+        return True
+    try:
+        return _ebv(expr, FrozenBindings(context, bindings))
+    except SPARQLError:
+        # an error filters the solution out
+        return False
+    except Exception:
+        return True
+
+
+def may_change(query, triples) -> bool:
+    """Whether adding or removing any of ``triples`` may change a query's result.
+
+    A triple can only change the result if it matches a triple pattern of the
+    query, with the constant terms it names (e.g. its predicates and types),
+    and passes the filters on that pattern which the match alone decides.
+
+    :param query: a SPARQL query, as text or prepared.
+    :param triples: the ``(s, p, o)`` triples added or removed.
+    """
+    if isinstance(query, str):
+        query = prepareQuery(query)
+    if query.algebra.name == "DescribeQuery":
+        # describes everything about the resources found
+        return bool(triples)
+    patterns = query_patterns(query)
+    context = QueryContext()
+    # the same few terms (types, predicates, hub nodes) recur across triples
+    results = {}
+    for triple in triples:
+        for pattern, filters in patterns:
+            bindings = bind(pattern, triple)
+            if bindings is None:
+                continue
+            for expr, needed in filters:
+                key = (id(expr), *(bindings.get(var) for var in needed or ()))
+                if key not in results:
+                    results[key] = passes(expr, needed, bindings, context)
+                if not results[key]:
+                    break
+            else:
+                return True
+    return False
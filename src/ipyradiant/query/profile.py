@@ -0,0 +1,74 @@
+""" per-phase timing of a query run
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# the phases of a run, in the order they happen
+PHASES = ["parse", "algebra", "evaluate", "dataframe", "collapse", "render"]
+
+
+class QueryProfile:
+    """Wall time, and optionally peak memory, of each phase of one query run.
+
+    A phase that runs again (e.g. rendering another page) replaces its record.
+
+    :param memory: trace allocations to record each phase's peak memory use;
+        this slows the run down several times over.
+    :param evaluation: capture a cProfile of the evaluation phase.
+    """
+
+    def __init__(self, memory: bool = False, evaluation: bool = False):
+        self.memory = memory
+        self.evaluation = evaluation
+        self.seconds = {}
+        self.peak_bytes = {}
+        self.stats = ""
+        self.started_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    @contextmanager
+    def phase(self, name: str):
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                # before Python 3.9 the peak can only be reset with the traces
+                tracemalloc.clear_traces()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = time.perf_counter() - start
+            if tracing:
+                self.peak_bytes[name] = tracemalloc.get_traced_memory()[1] - baseline
+
+    def call(self, name: str, function, *args, **kwargs):
+        """call ``function`` as the phase ``name`` (under cProfile if it evaluates)"""
+        with self.phase(name):
+            if not (self.evaluation and name == "evaluate"):
+                return function(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                out = io.StringIO()
+                stats = pstats.Stats(profiler, stream=out)
+                stats.sort_stats("cumulative").print_stats(30)
+                self.stats = out.getvalue()
+
+    def close(self):
+        """stop tracing allocations, if this profile started it"""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
@@ -3,6 +3,8 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
+import threading
+
 import traitlets as T
 
 import ipywidgets as W
@@ -15,12 +17,22 @@ query_template = """{}
 WHERE {}
 """
 
+# the section of the query each trait is rendered into
+SECTIONS = {
+    "namespaces": "namespaces",
+    "query_type": "header",
+    "query_line": "header",
+    "query_body": "body",
+}
+
 
 class QueryConstructor(W.HBox):
     """TODO
-    - way better templating and more efficient formatting
-    - replace individual observers with larger observer
+    - way better templating
     - move build_query to standalone function
+
+    Edits are rendered once they pause for ``delay`` seconds, and then only
+    the sections that changed; ``flush`` renders them at once.
     """
 
     convert_arrow = T.Instance(W.Image)
@@ -33,9 +45,16 @@ class QueryConstructor(W.HBox):
     query_line = T.Unicode(allow_none=True)
     query_body = T.Unicode()
 
+    # seconds without edits before the query is rebuilt; 0 to rebuild at once
+    delay = T.Float(default_value=0.25)
+
     log = W.Output()
 
     def __init__(self, *args, **kwargs):
+        self.sections = {}
+        self.stale = {"namespaces", "header", "body"}
+        self.lock = threading.RLock()
+        self.timer = None
         super().__init__(*args, **kwargs)
         self.query_input = QueryInput()
 
@@ -46,19 +65,20 @@ class QueryConstructor(W.HBox):
         T.link((self.query_input.body.body, "value"), (self, "query_body"))
 
         self.children = tuple([self.query_input, self.formatted_query])
+        self.flush()
+
+    def build_query(self) -> str:
+        return query_template.format(
+            self.render_namespaces(), self.render_header(), self.render_body()
+        )
+
+    def render_namespaces(self) -> str:
+        return self.namespaces
 
     @log.capture()
-    def build_query(self):
-        # get values TODO improve
-        namespaces = self.namespaces
+    def render_header(self) -> str:
         query_type = self.query_type
         query_line = self.query_line
-        query_body = self.query_body or self.query_input.body.body.placeholder
-
-        # update query_body
-        query_body = "\t\n".join(
-            query_body.split("\n")
-        )  # TODO this isn't actually formatting properly
 
         header_str = ""
         # TODO move these to module vars
@@ -75,8 +95,32 @@ class QueryConstructor(W.HBox):
         else:
             with self.log:
                 raise ValueError(f"Unexpected query type: {query_type}")
+        return header_str
 
-        return query_template.format(namespaces, header_str, query_body,)
+    def render_body(self) -> str:
+        query_body = self.query_body or self.query_input.body.body.placeholder
+        # TODO this isn't actually formatting properly
+        return "\t\n".join(query_body.split("\n"))
+
+    def flush(self) -> str:
+        """render the sections edited since the last rebuild, and show the query"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.stale:
+                return self.formatted_query.value
+            for section in sorted(self.stale):
+                self.sections[section] = getattr(self, f"render_{section}")()
+            self.stale.clear()
+            query = query_template.format(
+                self.sections["namespaces"],
+                self.sections["header"],
+                self.sections["body"],
+            )
+            if query != self.formatted_query.value:
+                self.formatted_query.value = query
+            return query
 
     @T.default("formatted_query")
     def make_default_formatted_query(self):
@@ -90,4 +134,14 @@ class QueryConstructor(W.HBox):
         "namespaces", "query_type", "query_line", "query_body",
     )
     def update_query(self, change):
-        self.formatted_query.value = self.build_query()
+        with self.lock:
+            self.stale.add(SECTIONS[change.name])
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.delay > 0:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if self.delay <= 0:
+            self.flush()
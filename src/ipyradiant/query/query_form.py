@@ -145,6 +145,7 @@ class LinkedLimitOffset(W.VBox):
     def update_limit_max(self, change):
         self.limit.max = change.new
         self.limit.value = change.new
+        self.offset.max = change.new
 
 
 class QueryInput(W.VBox):
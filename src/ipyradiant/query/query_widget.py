@@ -3,7 +3,10 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
-import re
+import html
+import threading
+import time
+import traceback
 
 import traitlets as T
 
@@ -12,8 +15,21 @@ import qgrid
 from pandas import DataFrame
 from rdflib import Graph, URIRef
 
-from .namespace_manager import collapse_namespace
+from ..loader.delta import GraphDelta
+from ..loader.search import EntityIndex
+from ..loader.stats import GraphStats
+from .cache import LRUCache, PreparedQueryCache, QueryResultCache
+from .endpoint import SPARQLEndpoint
+from .entity_search import EntityCombobox
+from .execution import QueryCancelled, QueryExecution
+from .export import export_result
+from .namespace_manager import NS_PATTERN as _NS_PATTERN
+from .namespace_manager import NamespaceCollapser
+from .optimizer import reorder_query
+from .profile import PHASES, QueryProfile
 from .query_constructor import QueryConstructor
+from .query_form import LinkedLimitOffset
+from .results import collapse_dataframe
 
 
 class QueryWidget(W.VBox):
@@ -27,41 +43,405 @@ class QueryWidget(W.VBox):
     """
 
     # namespace pattern
-    NS_PATTERN = re.compile(r"PREFIX ([\w]*): <(.+)>")
+    NS_PATTERN = _NS_PATTERN
 
     graph = T.Instance(Graph)
+    graph_delta = T.Instance(GraphDelta, allow_none=True)
+    graph_stats = T.Instance(GraphStats, allow_none=True)
+    entity_index = T.Instance(EntityIndex, allow_none=True)
+    entity_box = T.Instance(EntityCombobox)
     run_button = T.Instance(W.Button)
+    cancel_button = T.Instance(W.Button)
+    status_label = T.Instance(W.Label)
+    run_box = T.Instance(W.HBox)
     log = W.Output(layout={"border": "1px solid black"})
     qgridw = T.Instance(qgrid.QgridWidget)
-    current_dataframe = T.Instance(DataFrame)
+    current_dataframe = T.Instance(DataFrame, allow_none=True)
+    result_cache = T.Instance(QueryResultCache)
+    prepared_queries = T.Instance(PreparedQueryCache)
+    cache_hits = T.Int()
+    cache_misses = T.Int()
+    paginate = T.Bool(default_value=False)
+    page_size = T.Int(default_value=100)
+    limit_offset = T.Instance(LinkedLimitOffset)
+    virtual = T.Bool(default_value=False)
+    visible_rows = T.Int(default_value=30)
+    prefetch = T.Int(default_value=40)
+    window_start = T.Int()
+    row_slider = T.Instance(W.IntSlider)
+    background = T.Bool(default_value=True)
+    timeout = T.Float(default_value=None, allow_none=True)
+    tick = T.Float(default_value=0.5)
+    running = T.Bool()
+    elapsed = T.Float()
+    query_status = T.Unicode()
+    query_execution = T.Instance(QueryExecution, allow_none=True)
+    query_thread = T.Instance(threading.Thread, allow_none=True)
+    endpoint = T.Instance(SPARQLEndpoint, allow_none=True)
+    endpoint_url = T.Unicode()
+    endpoint_text = T.Instance(W.Text)
+    profile_memory = T.Bool(default_value=False)
+    profile_evaluation = T.Bool(default_value=False)
+    query_profile = T.Instance(QueryProfile, allow_none=True)
+    timings = T.Dict()
+    memory_peaks = T.Dict()
+    profile_stats = T.Unicode()
+    profile_table = T.Instance(W.HTML)
+    optimize = T.Bool(default_value=False)
+    join_order = T.List()
+    join_order_html = T.Instance(W.HTML)
+    profile_panel = T.Instance(W.Accordion)
+    export_path = T.Unicode(default_value="results.csv")
+    export_status = T.Unicode()
+    export_thread = T.Instance(threading.Thread, allow_none=True)
+    export_box = T.Instance(W.HBox)
 
     def __init__(self, graph: Graph = None, *args, **kwargs):
+        self.window_frozen = False
+        # (result cache version, stats) counted here when none are linked
+        self.counted_stats = None
+        # collapsed windows of the current result, in virtual mode
+        self.window_cache = LRUCache(maxsize=16)
         super().__init__(*args, **kwargs)
         if graph is not None:
             self.graph = graph
+        else:
+            self.result_cache.watch(self.graph)
         self.query_constructor = QueryConstructor()
-        self.children = [self.query_constructor, self.run_button, self.qgridw]
+        self.children = [
+            self.query_constructor,
+            self.entity_box,
+            self.run_box,
+            self.export_box,
+            self.limit_offset,
+            self.row_slider,
+            self.qgridw,
+            self.profile_panel,
+        ]
 
     @log.capture(clear_output=True)
     def run_query(self, button):
-        # Get all namespaces from the widget string
-        namespaces = self.NS_PATTERN.findall(self.query_constructor.namespaces)
+        self.query_profile = QueryProfile(self.profile_memory, self.profile_evaluation)
+        key, execution = self.execution(
+            self.query_constructor.flush(), profile=self.query_profile
+        )
+        current_dataframe = self.cached_result(key)
+        if current_dataframe is not None:
+            self.show_dataframe(current_dataframe)
+            self.query_profile.close()
+            self.publish_profile()
+            return
+        self.start_query(execution, key)
+
+    def execution(
+        self,
+        query: str,
+        init_bindings: dict = None,
+        namespaces: str = None,
+        profile: QueryProfile = None,
+    ) -> tuple:
+        """the result cache key of ``query`` and a QueryExecution to evaluate it
+
+        Locally, the query is parsed once per text and namespaces (by default
+        those of the namespace manager), so a template can be run for many
+        bindings at the cost of evaluating it. An endpoint parses the query
+        itself, and its results are not cached, as the remote data can change.
+        """
+        if namespaces is None:
+            namespaces = self.query_constructor.namespaces
+        if self.endpoint is not None:
+            if namespaces not in query:
+                query = f"{namespaces}\n{query}"
+            return (
+                None,
+                QueryExecution(None, query, init_bindings, self.endpoint, profile),
+            )
+        init_ns = dict(self.NS_PATTERN.findall(namespaces))
+        key = self.result_cache.key(query, init_ns, init_bindings)
+        prepared = self.prepared_queries.prepare(query, init_ns, profile)
+        if self.optimize:
+            prepared, orders = reorder_query(prepared, self.current_stats())
+            self.join_order = self.format_join_order(orders)
+        return key, QueryExecution(self.graph, prepared, init_bindings, None, profile)
+
+    def current_stats(self) -> GraphStats:
+        """the linked graph stats, or stats counted from the graph as it is now"""
+        if self.graph_stats is not None:
+            return self.graph_stats
+        version = self.result_cache.check()
+        if self.counted_stats is None or self.counted_stats[0] != version:
+            self.counted_stats = version, GraphStats.from_graph(self.graph)
+        return self.counted_stats[1]
+
+    def format_join_order(self, orders: list) -> list:
+        """each BGP's patterns as text, with their estimated matches"""
+        collapser = self.query_constructor.query_input.namespaces.collapser
+
+        def format_term(term):
+            if isinstance(term, URIRef):
+                return collapser.collapse(term)
+            return term.n3() if hasattr(term, "n3") else str(term)
+
+        return [
+            [
+                f"{' '.join(map(format_term, pattern))}  (~{matches:,.0f})"
+                for pattern, matches in ordered
+            ]
+            for ordered in orders
+        ]
+
+    def cached_result(self, key) -> DataFrame:
+        if key is None:
+            return None
+        df = self.result_cache.get(key)
+        self.cache_hits = self.result_cache.hits
+        self.cache_misses = self.result_cache.misses
+        return df
+
+    def run_prepared(
+        self, query: str, init_bindings: dict = None, namespaces: str = None
+    ) -> DataFrame:
+        """Run ``query`` against the graph with ``init_bindings`` for its variables.
 
-        res = self.graph.query(
-            self.query_constructor.formatted_query.value, initNs=dict(namespaces)
+        Unlike ``run_query`` this runs in the calling thread, without timeout.
+        """
+        key, execution = self.execution(query, init_bindings, namespaces)
+        df = self.cached_result(key)
+        if df is None:
+            df = execution.run()
+            if key is not None:
+                self.result_cache.put(key, df)
+        return df
+
+    def run_template(self, query: str, bindings: list, namespaces: str = None) -> list:
+        """a DataFrame of the results of ``query`` for each of ``bindings``"""
+        return [
+            self.run_prepared(query, init_bindings, namespaces)
+            for init_bindings in bindings
+        ]
+
+    def start_query(self, execution: QueryExecution, key):
+        """evaluate a query, in a background thread if ``background``
+
+        A watcher thread updates ``elapsed`` and stops the query after
+        ``timeout`` seconds; a stopped SELECT shows the rows found so far.
+        """
+        if self.running:
+            raise RuntimeError("Wait for (or cancel) the current query first.")
+        self.query_execution = execution
+        self.elapsed = 0
+        self.query_status = "running"
+        self.running = True
+        watcher = threading.Thread(
+            target=self.watch_query, args=(execution,), daemon=True
         )
-        self.current_dataframe = DataFrame(list(res))
-        collapsed_data = DataFrame(list(res))
-        for ii, row in collapsed_data.iterrows():
-            for jj, cell in enumerate(row):
-                if isinstance(cell, URIRef):
-                    collapsed_data.iat[ii, jj] = collapse_namespace(namespaces, cell)
-        self.qgridw.df = collapsed_data
+        watcher.start()
+        if self.background:
+            self.query_thread = threading.Thread(
+                target=self.run_execution, args=(execution, key, watcher), daemon=True
+            )
+            self.query_thread.start()
+        else:
+            self.run_execution(execution, key, watcher)
+
+    def run_execution(self, execution: QueryExecution, key, watcher: threading.Thread):
+        try:
+            try:
+                df = execution.run()
+            finally:
+                # let the watcher's last update land before the final status
+                watcher.join()
+        except QueryCancelled:
+            df = execution.partial
+            self.query_status = (
+                f"{execution.reason} after {execution.elapsed:.1f}s, {len(df)} rows"
+            )
+            self.show_dataframe(df)
+        except Exception:
+            self.query_status = "failed"
+            self.log.append_stderr(traceback.format_exc())
+        else:
+            if key is not None:
+                self.result_cache.put(key, df)
+            self.query_status = f"{len(df)} rows in {execution.elapsed:.2f}s"
+            self.show_dataframe(df)
+        finally:
+            execution.profile.close()
+            self.publish_profile()
+            self.elapsed = execution.elapsed
+            self.running = False
+
+    def watch_query(self, execution: QueryExecution):
+        while not execution.done.wait(self.tick):
+            self.elapsed = execution.elapsed
+            self.query_status = f"running {self.elapsed:.1f}s"
+            if self.timeout is not None and self.elapsed > self.timeout:
+                execution.stop("timed out")
+
+    def cancel_query(self, button=None):
+        """stop the running query, keeping the rows found so far"""
+        if self.query_execution is not None:
+            self.query_execution.stop()
+
+    def wait(self, timeout: float = None):
+        """block until the current background query and export (if any) are done"""
+        for thread in (self.query_thread, self.export_thread):
+            if thread is not None:
+                thread.join(timeout)
+
+    @log.capture()
+    def export_query(self, button=None, path: str = None):
+        """Stream the results of the current query to a file on the kernel host.
+
+        Rows are written in batches as they are found, without building a
+        DataFrame; the format follows the suffix of ``path`` (by default
+        ``export_path``): ``.csv``, ``.parquet`` or ``.arrow``.
+        """
+        if self.export_thread is not None and self.export_thread.is_alive():
+            raise RuntimeError("Wait for the current export first.")
+        path = path or self.export_path
+        _, execution = self.execution(self.query_constructor.flush())
+        if self.background:
+            self.export_thread = threading.Thread(
+                target=self.run_export, args=(execution, path), daemon=True
+            )
+            self.export_thread.start()
+        else:
+            self.run_export(execution, path)
+
+    def run_export(self, execution: QueryExecution, path: str):
+        self.export_status = f"exporting to {path}"
+        start = time.perf_counter()
+        try:
+            n_rows = export_result(execution.result(), path)
+        except Exception:
+            self.export_status = "export failed"
+            self.log.append_stderr(traceback.format_exc())
+        else:
+            seconds = time.perf_counter() - start
+            self.export_status = (
+                f"{n_rows:,} rows to {path} in {seconds:.2f}s"
+                f" ({n_rows / max(seconds, 1e-6):,.0f} rows/s)"
+            )
+
+    def show_dataframe(self, df: DataFrame):
+        # an unchanged result is already on display
+        if df is not self.current_dataframe:
+            self.current_dataframe = df
+            self.reset_window()
+
+    def reset_window(self):
+        """fit the limit/offset and row sliders to the current result, at its start"""
+        n_rows = len(self.current_dataframe)
+        limit_offset = self.limit_offset
+        self.window_cache.entries.clear()
+        self.window_frozen = True
+        try:
+            limit_offset.max_len = n_rows
+            limit_offset.limit_enabled = True
+            limit_offset.limit.value = min(self.page_size, n_rows)
+            limit_offset.offset.value = 0
+            self.window_start = 0
+            self.row_slider.max = max(0, n_rows - 1)
+        finally:
+            self.window_frozen = False
+        self.show_results()
+
+    @log.capture()
+    def show_results(self, change=None):
+        """collapse and display the current result, or only its window when
+        paging or virtual"""
+        df = self.current_dataframe
+        if df is None or self.window_frozen:
+            return
+        collapser = self.query_constructor.query_input.namespaces.collapser
+        profile = self.query_profile or QueryProfile()
+        if self.virtual:
+            collapsed = self.virtual_window(df, collapser, profile)
+        else:
+            if self.paginate:
+                start = self.limit_offset.offset.value
+                stop = None
+                if self.limit_offset.limit_enabled:
+                    stop = start + self.limit_offset.limit.value
+                df = df.iloc[start:stop]
+            with profile.phase("collapse"):
+                collapsed = collapse_dataframe(df, collapser)
+        with profile.phase("render"):
+            self.qgridw.df = collapsed
+        self.publish_profile()
+
+    def virtual_window(
+        self, df: DataFrame, collapser: NamespaceCollapser, profile: QueryProfile
+    ) -> DataFrame:
+        """Collapse the rows from ``window_start`` on that fill the grid, and
+        ``prefetch`` more to scroll through.
+
+        The rows keep their labels in the whole result. Recent windows are
+        kept collapsed, so going back to one sends it without collapsing it
+        again. The grid's sorting and filtering only see the window.
+        """
+        start = self.window_start
+        stop = start + self.visible_rows + self.prefetch
+        key = (start, stop, collapser)
+        collapsed = self.window_cache.get(key)
+        if collapsed is None:
+            with profile.phase("collapse"):
+                collapsed = collapse_dataframe(df.iloc[start:stop], collapser)
+            self.window_cache.put(key, collapsed)
+        return collapsed
+
+    @log.capture()
+    def follow_viewport(self, event, qgridw):
+        """in virtual mode, move the window on once the grid is scrolled to its end"""
+        df = self.current_dataframe
+        if not self.virtual or df is None:
+            return
+        top, bottom = event["new"]
+        n_window = len(qgridw.df)
+        if bottom + 1 >= n_window and self.window_start + n_window < len(df):
+            # the row at the top stays at the top of the next window
+            self.window_start += top
+
+    def publish_profile(self):
+        """copy the current run's profile to the timing traits"""
+        profile = self.query_profile
+        if profile is None:
+            return
+        self.timings = {
+            phase: profile.seconds[phase]
+            for phase in PHASES
+            if phase in profile.seconds
+        }
+        self.memory_peaks = {
+            phase: profile.peak_bytes[phase]
+            for phase in PHASES
+            if phase in profile.peak_bytes
+        }
+        self.profile_stats = profile.stats
 
     @T.default("graph")
     def make_default_graph(self):
         return Graph()
 
+    @T.default("result_cache")
+    def make_default_result_cache(self):
+        return QueryResultCache()
+
+    @T.default("prepared_queries")
+    def make_default_prepared_queries(self):
+        return PreparedQueryCache()
+
+    @T.observe("graph")
+    def update_result_cache(self, change):
+        # watching the new graph lets go of the old one, and invalidates
+        self.result_cache.watch(change.new)
+
+    @T.observe("graph_delta")
+    def invalidate_result_cache(self, change):
+        # not every store reports removals, so a linked delta also invalidates
+        self.result_cache.invalidate()
+
     @T.default("qgridw")
     def make_default_qgridw(self):
         qgridw = qgrid.show_grid(
@@ -70,8 +450,50 @@ class QueryWidget(W.VBox):
             column_options={"editable": False},
             column_definitions={"index": {"width": "20"}},
         )
+        qgridw.on("viewport_changed", self.follow_viewport)
         return qgridw
 
+    @T.default("limit_offset")
+    def make_default_limit_offset(self):
+        limit_offset = LinkedLimitOffset(layout=W.Layout(display="none"))
+        limit_offset.limit.observe(self.show_results, "value")
+        limit_offset.offset.observe(self.show_results, "value")
+        limit_offset.observe(self.show_results, "limit_enabled")
+        return limit_offset
+
+    @T.observe("paginate")
+    def update_paginate(self, change):
+        self.limit_offset.layout.display = None if change.new else "none"
+        self.show_results()
+
+    @T.observe("page_size")
+    def update_page_size(self, change):
+        # re-window the result on display, from the current offset
+        if self.current_dataframe is None:
+            return
+        n_rows = len(self.current_dataframe)
+        self.limit_offset.limit.value = min(change.new, n_rows)
+
+    @T.default("row_slider")
+    def make_default_row_slider(self):
+        slider = W.IntSlider(
+            description="Row",
+            continuous_update=False,
+            layout=W.Layout(display="none", width="100%"),
+        )
+        T.link((slider, "value"), (self, "window_start"))
+        return slider
+
+    @T.observe("virtual")
+    def update_virtual(self, change):
+        self.row_slider.layout.display = None if change.new else "none"
+        self.show_results()
+
+    @T.observe("window_start", "visible_rows", "prefetch")
+    def update_virtual_window(self, change):
+        if self.virtual:
+            self.show_results()
+
     @T.default("run_button")
     def make_default_run_button(self):
         button = W.Button(
@@ -80,4 +502,171 @@ class QueryWidget(W.VBox):
             tooltip="Click to execute query with current configuration.",
         )
         button.on_click(self.run_query)
+        T.dlink((self, "running"), (button, "disabled"))
         return button
+
+    @T.default("cancel_button")
+    def make_default_cancel_button(self):
+        button = W.Button(
+            description="Cancel",
+            icon="stop",
+            tooltip="Stop the running query, keeping the rows found so far.",
+            layout=W.Layout(visibility="hidden"),
+        )
+        button.on_click(self.cancel_query)
+        T.dlink(
+            (self, "running"),
+            (button.layout, "visibility"),
+            lambda running: "visible" if running else "hidden",
+        )
+        return button
+
+    @T.default("status_label")
+    def make_default_status_label(self):
+        label = W.Label()
+        T.dlink((self, "query_status"), (label, "value"))
+        return label
+
+    @T.default("run_box")
+    def make_default_run_box(self):
+        return W.HBox(
+            [self.run_button, self.cancel_button, self.status_label, self.endpoint_text]
+        )
+
+    @T.default("entity_box")
+    def make_default_entity_box(self):
+        box = EntityCombobox(
+            description="Insert",
+            placeholder="Find an IRI or label to add to the query...",
+            layout=W.Layout(width="50%"),
+        )
+        T.dlink((self, "entity_index"), (box, "index"))
+        T.dlink(
+            (self.query_constructor.query_input.namespaces, "collapser"),
+            (box, "collapser"),
+        )
+        box.observe(self.insert_entity, "term")
+        return box
+
+    @log.capture()
+    def insert_entity(self, change):
+        """add the picked IRI to the query body, before its closing brace"""
+        term = change.new
+        if term is None:
+            return
+        collapsed = self.query_constructor.query_input.namespaces.collapser.collapse(
+            term
+        )
+        text = term.n3() if collapsed == str(term) else collapsed
+        body = self.query_constructor.query_input.body.body
+        value = body.value or body.placeholder
+        end = value.rfind("}")
+        if end < 0:
+            body.value = f"{value} {text}"
+        else:
+            body.value = f"{value[:end].rstrip()} {text}\n{value[end:]}"
+        # ready for the next pick, even of the same IRI
+        self.entity_box.term = None
+        self.entity_box.value = ""
+
+    @T.default("export_box")
+    def make_default_export_box(self):
+        path = W.Text(
+            description="Export to",
+            placeholder="results.parquet",
+            tooltip="A .csv, .parquet or .arrow file on the kernel host.",
+        )
+        T.link((path, "value"), (self, "export_path"))
+        button = W.Button(
+            description="Export",
+            icon="download",
+            tooltip="Stream the results of the query to the file.",
+        )
+        button.on_click(self.export_query)
+        status = W.Label()
+        T.dlink((self, "export_status"), (status, "value"))
+        return W.HBox([path, button, status])
+
+    @T.default("profile_panel")
+    def make_default_profile_panel(self):
+        memory = W.Checkbox(description="Peak memory (slow)", indent=False)
+        T.link((memory, "value"), (self, "profile_memory"))
+        evaluation = W.Checkbox(description="cProfile evaluation", indent=False)
+        T.link((evaluation, "value"), (self, "profile_evaluation"))
+        stats = W.HTML()
+        T.dlink((self, "profile_stats"), (stats, "value"), self.format_profile_stats)
+        optimize = W.Checkbox(
+            description="Reorder patterns by selectivity", indent=False
+        )
+        T.link((optimize, "value"), (self, "optimize"))
+        panel = W.Accordion(
+            [
+                W.VBox([W.HBox([memory, evaluation]), self.profile_table, stats]),
+                W.VBox([optimize, self.join_order_html]),
+            ]
+        )
+        panel.set_title(0, "Profile")
+        panel.set_title(1, "Join order")
+        panel.selected_index = None
+        return panel
+
+    @T.default("join_order_html")
+    def make_default_join_order_html(self):
+        return W.HTML()
+
+    @T.observe("join_order")
+    def update_join_order_html(self, change):
+        self.join_order_html.value = "".join(
+            "<ol>"
+            + "".join(f"<li><code>{html.escape(line)}</code></li>" for line in lines)
+            + "</ol>"
+            for lines in change.new
+        )
+
+    @T.default("profile_table")
+    def make_default_profile_table(self):
+        return W.HTML()
+
+    @T.observe("timings", "memory_peaks")
+    def update_profile_table(self, change):
+        self.profile_table.value = self.format_timings()
+
+    def format_timings(self) -> str:
+        rows = "".join(
+            f"<tr><td>{phase}</td><td>{seconds * 1000:.1f} ms</td>"
+            + (
+                f"<td>{self.memory_peaks[phase] / 2 ** 20:.1f} MiB</td>"
+                if phase in self.memory_peaks
+                else "<td></td>"
+            )
+            + "</tr>"
+            for phase, seconds in self.timings.items()
+        )
+        return f"<table><tr><th>phase</th><th>time</th><th>peak</th></tr>{rows}</table>"
+
+    @staticmethod
+    def format_profile_stats(stats: str) -> str:
+        return f"<pre>{html.escape(stats)}</pre>" if stats else ""
+
+    @T.default("endpoint_text")
+    def make_default_endpoint_text(self):
+        text = W.Text(
+            placeholder="SPARQL endpoint URL (blank: query the loaded graph)",
+            continuous_update=False,
+        )
+        T.link((text, "value"), (self, "endpoint_url"))
+        return text
+
+    @T.observe("endpoint_url")
+    def update_endpoint(self, change):
+        if self.endpoint is not None:
+            self.endpoint.close()
+            self.endpoint = None
+        if not change.new:
+            return
+        try:
+            self.endpoint = SPARQLEndpoint(change.new)
+        except ValueError as err:
+            # e.g. a URL typed without its scheme: keep querying the graph
+            self.query_status = f"bad endpoint: {err}"
+            self.log.append_stderr(f"{err}\n")
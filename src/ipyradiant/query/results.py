@@ -0,0 +1,148 @@
+""" column-wise conversion of query results to dictionary-encoded DataFrames
+"""
+# Copyright (c) 2020 ipyradiant contributors.
+# Distributed under the terms of the Modified BSD License.
+
+import numpy as np
+from pandas import Categorical, CategoricalDtype, DataFrame, Index, Series, factorize
+from rdflib import URIRef
+from rdflib.query import Result
+
+from .namespace_manager import NamespaceCollapser
+
+
+def binding_columns(variables, bindings) -> dict:
+    """``{name: column}`` for a list of SELECT solutions"""
+    return {str(var): [row.get(var) for row in bindings] for var in variables}
+
+
+def result_columns(result: Result) -> dict:
+    """the result as ``{name: column}``, without a DataFrame per row or cell
+
+    SELECT columns are named by their variables; ASK gives a single ``ask``
+    column and CONSTRUCT/DESCRIBE give ``subject``, ``predicate``, ``object``.
+    """
+    if result.type == "ASK":
+        return {"ask": [result.askAnswer]}
+    if result.type == "SELECT":
+        # read the solution dicts directly: building a ResultRow per solution
+        # costs several times more than the lookups themselves
+        return binding_columns(result.vars, result.bindings)
+    names = ["subject", "predicate", "object"]
+    # transpose the triples in one pass; pad when there are none
+    columns = list(zip(*result)) or [()] * len(names)
+    return dict(zip(names, columns))
+
+
+def from_codes(codes, categories) -> Categorical:
+    # an object Index keeps the terms themselves, rather than their strings
+    dtype = CategoricalDtype(Index(categories, dtype=object))
+    return Categorical.from_codes(codes, dtype=dtype)
+
+
+def categorical(codes, categories: list) -> Categorical:
+    """``categories[code]`` for each code (-1 for a missing value), with equal
+    categories merged into one"""
+    unique = {}
+    remap = [unique.setdefault(category, len(unique)) for category in categories]
+    codes = np.asarray(codes)
+    if len(unique) < len(categories):
+        codes = np.where(codes < 0, -1, np.asarray(remap)[codes])
+    return from_codes(codes, list(unique))
+
+
+def is_repetitive(n_distinct: int, n_cells: int) -> bool:
+    """whether a column is worth dictionary-encoding: for mostly distinct terms
+    the codes only add to the cells (and qgrid would send both)"""
+    return 0 < n_distinct and 2 * n_distinct <= n_cells
+
+
+def encode_column(column) -> Series:
+    """``column`` as a Series, dictionary-encoded if its terms repeat
+
+    A categorical column stores each distinct term once and each cell as a
+    small integer code, with unbound cells missing. Other columns hold the
+    terms as objects, with unbound cells as None.
+    """
+    values = np.empty(len(column), dtype=object)
+    values[:] = column
+    codes, terms = factorize(values)
+    if is_repetitive(len(terms), len(values)):
+        return Series(from_codes(codes, terms))
+    return Series(values, dtype=object)
+
+
+def columns_dataframe(columns: dict) -> DataFrame:
+    return DataFrame({name: encode_column(column) for name, column in columns.items()})
+
+
+def result_dataframe(result: Result) -> DataFrame:
+    return columns_dataframe(result_columns(result))
+
+
+def bindings_dataframe(variables, bindings) -> DataFrame:
+    return columns_dataframe(binding_columns(variables, bindings))
+
+
+def import_pyarrow():
+    """pyarrow, which only Arrow output needs"""
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError(
+            'Arrow output needs pyarrow: pip install "ipyradiant[arrow]"'
+        ) from error
+    return pyarrow
+
+
+def arrow_table(df: DataFrame):
+    """``df`` as a pyarrow Table of term strings, with unbound cells as nulls
+
+    Categorical columns stay dictionary-encoded.
+    """
+    pa = import_pyarrow()
+    arrays = {}
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, CategoricalDtype):
+            codes = np.asarray(column.cat.codes)
+            dictionary = pa.array(
+                [str(term) for term in column.cat.categories], type=pa.string()
+            )
+            arrays[str(name)] = pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0), dictionary
+            )
+        else:
+            arrays[str(name)] = pa.array(
+                [None if term is None else str(term) for term in column],
+                type=pa.string(),
+            )
+    return pa.table(arrays)
+
+
+def collapse_column(column: Series, collapser: NamespaceCollapser) -> Series:
+    """``column`` with its URIs collapsed, once per distinct term"""
+    if isinstance(column.dtype, CategoricalDtype):
+        values = column.array
+        if len(values) < len(values.categories):
+            # e.g. one page of a large result: only collapse what is on it
+            values = values.remove_unused_categories()
+        categories = [
+            collapser.link(term) if isinstance(term, URIRef) else term
+            for term in values.categories
+        ]
+        if is_repetitive(len(categories), len(values)):
+            return Series(categorical(values.codes, categories), index=column.index)
+        collapsed = np.array(categories + [None], dtype=object)[values.codes]
+        return Series(collapsed, index=column.index, dtype=object)
+    collapsed = {
+        term: collapser.link(term) for term in set(column) if isinstance(term, URIRef)
+    }
+    return Series(
+        [collapsed.get(term, term) for term in column], index=column.index, dtype=object
+    )
+
+
+def collapse_dataframe(df: DataFrame, collapser: NamespaceCollapser) -> DataFrame:
+    """a copy of ``df`` with URIs collapsed to prefixed links"""
+    return DataFrame({name: collapse_column(df[name], collapser) for name in df.columns})
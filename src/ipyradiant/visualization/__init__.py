@@ -8,9 +8,10 @@ __all__ = [
     "DatashaderVisualizer",
     "VisualizerBase",
     "LayoutSelector",
+    "NodeFinder",
     "NXBase",
 ]
 from .base import NXBase, VisualizerBase
 from .cytoscape import CytoscapeVisualizer
 from .datashader_vis import DatashaderVisualizer
-from .tools import LayoutSelector
+from .tools import LayoutSelector, NodeFinder
@@ -9,12 +9,19 @@ import ipywidgets as W
 import networkx as nx
 from rdflib import Graph, URIRef
 
+from ..loader.delta import GraphDelta
+from ..loader.triple_table import TripleTable
+from ..query.namespace_manager import NamespaceCollapser
+
 
 class VisualizerBase(W.VBox):
     """
     The basic Visualization class that takes the shape of an ipywidgets.VBox
 
     :param graph: an rdflib.graph.Graph object to visualize.
+    :param triple_table: a TripleTable to visualize instead of the graph, if given.
+    :param graph_delta: the latest GraphDelta already applied to the graph in place.
+    :param collapser: a NamespaceCollapser used to shorten node labels, if given.
     :param edge_color: a string, the desired color of edges.
     :param node_color: a string, the desired color of nodes.
     :param selected_nodes: a tuple of URIRefs of nodes currently selected either via tap or box select.
@@ -22,6 +29,9 @@ class VisualizerBase(W.VBox):
     """
 
     graph = T.Instance(Graph, allow_none=True)
+    triple_table = T.Instance(TripleTable, allow_none=True)
+    graph_delta = T.Instance(GraphDelta, allow_none=True)
+    collapser = T.Instance(NamespaceCollapser, allow_none=True)
     _vis = T.Instance(W.Box, allow_none=True)
     edge_color = T.Unicode(default_value="pink")
     node_color = T.Unicode(default_value="grey")
@@ -1,15 +1,19 @@
 # Copyright (c) 2020 ipyradiant contributors.
 # Distributed under the terms of the Modified BSD License.
 
+from itertools import chain
 from pathlib import Path
 
 import traitlets as T
 
 import ipywidgets as W
+import numpy as np
 from ipycytoscape import CytoscapeWidget
 from rdflib import Graph, Literal, URIRef
 from rdflib.namespace import RDF
 
+from ..loader.delta import GraphDelta
+from ..loader.triple_table import TripleTable
 from .base import VisualizerBase
 
 
@@ -95,16 +99,102 @@ class CytoscapeVisualizer(VisualizerBase):
             print(f'edge target: {edge["data"]["target"]}')
             print("-------------------------------")
 
-    @T.observe("graph")
+    @T.observe("graph", "triple_table", "collapser")
     def update_cyto_widget_graph(self, change):
+        if self.graph is None and self.triple_table is None:
+            return
         for node in list(self.cyto_widget.graph.nodes):
             self.cyto_widget.graph.remove_node(node)
         if len(self.cyto_widget.graph.nodes) != 0:
             with self.log:
                 print("Unexpected number of nodes remaining after graph cleared.")
-        new_json = self.build_cytoscape_json(change.new)
+        if self.triple_table is not None:
+            new_json = self.build_cytoscape_json_from_table(self.triple_table)
+        else:
+            new_json = self.build_cytoscape_json(self.graph)
         self.cyto_widget.graph.add_graph_from_json(new_json, directed=True)
 
+    @T.observe("selected_nodes")
+    def update_cyto_selection(self, change):
+        """select the nodes of ``selected_nodes`` in the widget, e.g. once found"""
+        selected = {str(node) for node in change.new}
+        for node in self.cyto_widget.graph.nodes:
+            node.selected = str(node.data["id"]) in selected
+
+    @T.observe("graph_delta")
+    def update_cyto_widget_delta(self, change):
+        delta = change.new
+        if delta is None or self.graph is None or self.triple_table is not None:
+            return
+        self.remove_delta(self.graph, delta)
+        added = Graph()
+        for triple in delta.added:
+            added.add(triple)
+        new_json = self.build_cytoscape_json(added)
+        self.cyto_widget.graph.add_graph_from_json(new_json, directed=True)
+
+    def remove_delta(self, graph: Graph, delta: GraphDelta):
+        """
+        Remove the edges and nodes that the removed triples of a
+        delta leave without any remaining link in the graph.
+
+        Only one edge is drawn between two nodes, labelled with the predicate
+        of the first triple linking them; when that triple is removed but
+        another still links the nodes, the edge is drawn again with its label.
+        """
+        cyto_graph = self.cyto_widget.graph
+        edges = {}
+        for edge in cyto_graph.edges:
+            data = edge.data
+            edges[str(data["source"]), str(data["target"]), data["label"]] = edge
+        redrawn = []
+        nodes = set()
+        for s, p, o in delta.removed:
+            if p == RDF.type:
+                continue
+            nodes.update(node for node in (s, o) if isinstance(node, URIRef))
+            if isinstance(o, Literal):
+                continue
+            edge = edges.pop((str(s), str(o), Path(p).name), None)
+            if edge is None:
+                continue
+            try:
+                cyto_graph.remove_edge(edge)
+            except (KeyError, ValueError):
+                pass
+            remaining = [p for p in graph.predicates(s, o) if p != RDF.type]
+            if remaining:
+                label = Path(remaining[0]).name
+                redrawn.append({"source": s, "target": o, "label": label})
+        for node in nodes:
+            linked = any(
+                p != RDF.type
+                for p in chain(
+                    graph.predicates(node, None), graph.predicates(None, node)
+                )
+            )
+            if not linked:
+                try:
+                    cyto_graph.remove_node_by_id(node)
+                except ValueError:
+                    pass
+        if redrawn:
+            cyto_graph.add_graph_from_json(
+                {"nodes": [], "edges": [{"data": data} for data in redrawn]},
+                directed=True,
+            )
+
+    def build_node(self, uri):
+        if self.collapser is not None:
+            name = self.collapser.collapse(uri)
+        else:
+            pathed_node = Path(uri)
+            name = f"{pathed_node.parent.name} {pathed_node.name}"
+        return {
+            "id": uri,
+            "name": name,
+        }
+
     def build_cytoscape_json(self, graph: Graph):
         """
         A function to build the specific json format that
@@ -125,12 +215,34 @@ class CytoscapeVisualizer(VisualizerBase):
         # create nodes
         nodes = {}
         for uri in element_set:
-            pathed_node = Path(uri)
-            nodes[uri] = {
-                "id": uri,
-                "name": f"{pathed_node.parent.name} {pathed_node.name}",
-            }
+            nodes[uri] = self.build_node(uri)
         return {
             "nodes": [{"data": v} for v in nodes.values()],
             "edges": [{"data": v} for v in edges],
         }
+
+    def build_cytoscape_json_from_table(self, table: TripleTable):
+        """
+        The same json as build_cytoscape_json, read straight from
+        the id columns of a TripleTable.
+        """
+        terms = table.terms
+        spo = table.spo
+        type_id = table.term_id(RDF.type)
+        if type_id is not None:
+            spo = spo[spo[:, 1] != type_id]
+        is_literal = table.literal_mask()
+        # collect uris & edges
+        element_set = {
+            terms[i]
+            for i in np.unique(spo[:, [0, 2]]).tolist()
+            if isinstance(terms[i], URIRef)
+        }
+        edges = [
+            {"source": terms[s], "target": terms[o], "label": Path(terms[p]).name}
+            for s, p, o in spo[~is_literal[spo[:, 2]]].tolist()
+        ]
+        return {
+            "nodes": [{"data": self.build_node(uri)} for uri in element_set],
+            "edges": [{"data": v} for v in edges],
+        }
@@ -6,12 +6,15 @@ import traitlets as T
 import holoviews as hv
 import IPython
 import ipywidgets as W
+import networkx as nx
 from bokeh.models import HoverTool
 from holoviews import streams
 from holoviews.operation.datashader import bundle_graph
 from rdflib import Graph, URIRef
 from rdflib.extras.external_graph_libs import rdflib_to_networkx_graph
 
+from ..loader.triple_table import TripleTable
+from ..query.patterns import may_change
 from .base import NXBase
 
 hv.extension("bokeh", logo=False)
@@ -24,6 +27,8 @@ class DatashaderVisualizer(NXBase):
     :param graph: an rdflib.graph.Graph object to visualize.
     :param tooltip: takes either 'nodes' or 'edges', and sets the hover tool.
     :param sparql: a query you'd like to perform on the rdflib.graph.Grab object.
+    :param max_edges: the number of edges drawn from a triple_table (the sparql
+        query does not apply to it).
     """
 
     output = T.Instance(W.Output)
@@ -32,6 +37,8 @@ class DatashaderVisualizer(NXBase):
     node_tooltips = T.List()
     edge_tooltips = T.List()
     sparql = T.Unicode()
+    constructed = T.Set()
+    max_edges = T.Int(default_value=300)
 
     @T.default("output")
     def _make_default_output(self):
@@ -92,11 +99,8 @@ class DatashaderVisualizer(NXBase):
         via the 'sparql' parameter
         """
 
-        sparql = self.sparql
-        qres = rdf_graph.query(sparql)
-        uri_graph = Graph()
-        for row in qres:
-            uri_graph.add(row)
+        uri_graph = self.construct_graph(rdf_graph)
+        self.constructed = set(uri_graph)
 
         new_netx = rdflib_to_networkx_graph(uri_graph)
         original = hv.Graph.from_networkx(
@@ -105,6 +109,45 @@ class DatashaderVisualizer(NXBase):
         output_graph = bundle_graph(original)
         return output_graph
 
+    def construct_graph(self, rdf_graph: Graph):
+        """
+        Perform the sparql query, collecting the constructed triples in a graph.
+        """
+        qres = rdf_graph.query(self.sparql)
+        uri_graph = Graph()
+        for row in qres:
+            uri_graph.add(row)
+        return uri_graph
+
+    @T.observe("graph_delta")
+    def changed_delta(self, change):
+        """
+        Only redo the (expensive) layout when the delta changed
+        the triples that the sparql query selects for display,
+        and only query again when the delta has triples it could select.
+        """
+        if change.new is None or self.graph is None or self.triple_table is not None:
+            return
+        if not may_change(self.sparql, change.new.added | change.new.removed):
+            return
+        if set(self.construct_graph(self.graph)) != self.constructed:
+            self.changed_layout(change)
+
+    def produce_table_graph(self, table: TripleTable):
+        """
+        A function that takes the node-to-node edges of a TripleTable
+        and transforms them into a datashader holoviews graph.
+        """
+        terms = table.terms
+        new_netx = nx.Graph()
+        new_netx.add_edges_from(
+            (terms[s], terms[o]) for s, _, o in table.edges()[: self.max_edges].tolist()
+        )
+        original = hv.Graph.from_networkx(
+            new_netx, self._nx_layout, **self.graph_layout_params
+        )
+        return bundle_graph(original)
+
     def set_options(self, output_graph):
         return output_graph.options(
             frame_width=1000,
@@ -133,16 +176,27 @@ class DatashaderVisualizer(NXBase):
         ]
         self.selected_nodes = tuple([URIRef(_) for _ in list(values["index"])])
 
-    @T.observe("_nx_layout", "sparql", "graph", "graph_layout_params")
+    @T.observe(
+        "_nx_layout",
+        "sparql",
+        "graph",
+        "triple_table",
+        "max_edges",
+        "graph_layout_params",
+    )
     def changed_layout(self, change):
-        if self.graph is None:
+        table = self.triple_table
+        if self.graph is None and table is None:
             self.output_graph = None
             self.display_datashader_vis(self.output_graph)
-        elif len(self.graph) == 0:
+        elif len(table if table is not None else self.graph) == 0:
             self.output_graph = None
             self.display_datashader_vis("Cannot display blank graph.")
         else:
-            self.output_graph = self.strip_and_produce_rdf_graph(self.graph)
+            if table is not None:
+                self.output_graph = self.produce_table_graph(table)
+            else:
+                self.output_graph = self.strip_and_produce_rdf_graph(self.graph)
             self.tap_selection_stream = streams.Tap(source=self.output_graph)
             self.tap_selection_stream.add_subscriber(self.tap_stream_subscriber)
             self.box_selection_stream = streams.BoundsXY(source=self.output_graph)
@@ -5,6 +5,7 @@ import traitlets as T
 
 import ipywidgets as W
 
+from ..query.entity_search import EntityCombobox
 from .base import VisualizerBase
 
 
@@ -17,3 +18,27 @@ class LayoutSelector(W.Dropdown):
             return
         T.link((change.new, "graph_layout_options"), (self, "options"))
         T.link((change.new, "graph_layout"), (self, "value"))
+
+
+class NodeFinder(EntityCombobox):
+    """Selects the node picked from the suggestions in the visualizer ``vis``.
+
+    Link ``index`` to a LoadWidget's ``entity_index`` to search its graph.
+    """
+
+    vis = T.Instance(VisualizerBase)
+
+    @T.default("placeholder")
+    def make_default_placeholder(self):
+        return "Find a node by IRI or label..."
+
+    @T.observe("vis")
+    def _update_collapser(self, change):
+        if change.new is None:
+            return
+        T.dlink((change.new, "collapser"), (self, "collapser"))
+
+    @T.observe("term")
+    def select_node(self, change):
+        if change.new is not None and self.vis is not None:
+            self.vis.selected_nodes = (change.new,)